@@ -0,0 +1,99 @@
+"""
+Сравнение построчной коррекции охвата и CTR (как в stata.py до векторизации)
+с векторизованными campaign_data.adjust_coverage и safe_divide.
+
+Проверяется совпадение результатов на синтетических выгрузках, в том числе со строковым охватом
+('0,25'), пустыми и нулевыми значениями и нулевыми / пустыми показами.
+
+Запуск: python benchmarks/bench_coverage.py [число строк]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campaign_data import adjust_coverage, safe_divide  # noqa: E402
+
+
+def make_stats(n_rows, seed=0):
+    """Синтетическая выгрузка: показы, клики и охват в разных записях."""
+    rng = np.random.default_rng(seed)
+    impressions = rng.integers(0, 100_000, n_rows).astype(float)
+    impressions[rng.random(n_rows) < 0.05] = 0
+    impressions[rng.random(n_rows) < 0.05] = np.nan
+    clicks = rng.integers(0, 1_000, n_rows).astype(float)
+
+    kind = rng.integers(0, 6, n_rows)
+    coverage = np.select(
+        [kind == 0, kind == 1, kind == 2, kind == 3, kind == 4],
+        [rng.integers(1, 50_000, n_rows).astype(float),   # целые
+         rng.integers(1, 1000, n_rows) / 1000,             # доли с тремя знаками (проценты)
+         rng.integers(1, 100, n_rows) / 100,               # доли с двумя знаками
+         np.zeros(n_rows),                                 # нули
+         np.full(n_rows, np.nan)],                         # пустые
+        rng.uniform(1, 10_000, n_rows).round(1))           # дробные больше 1
+    coverage = pd.Series(coverage, dtype=object)
+    # Часть охвата записана строками с десятичной запятой
+    as_text = rng.random(n_rows) < 0.2
+    coverage[as_text] = coverage[as_text].map(lambda v: str(v).replace(".", ","))
+
+    return pd.DataFrame({"показы": impressions, "клики": clicks, "охват": coverage})
+
+
+def legacy_coverage(row):
+    """Построчная коррекция охвата из stata.py."""
+    coverage = row["охват"]
+    impressions = row["показы"]
+
+    if isinstance(coverage, str):
+        coverage = coverage.replace(",", ".")
+        coverage = pd.to_numeric(coverage, errors="coerce")
+
+    if pd.isna(coverage) or coverage == 0:
+        return 0
+
+    if 0 < coverage < 1:
+        str_coverage = str(coverage)
+        if len(str_coverage.split('.')[1]) > 2:
+            coverage *= 100
+
+    if coverage > 0 and impressions > 0 and impressions / coverage > 10:
+        return impressions * coverage
+
+    return round(coverage)
+
+
+def legacy(df):
+    coverage = df.apply(legacy_coverage, axis=1)
+    ctr = df.apply(lambda row: row["клики"] / row["показы"] if row["показы"] > 0 else 0, axis=1)
+    return coverage.astype(float), ctr.astype(float)
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    df = make_stats(n_rows)
+
+    t0 = time.perf_counter()
+    old_coverage, old_ctr = legacy(df)
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    coverage = adjust_coverage(df["охват"], df["показы"])
+    ctr = safe_divide(df["клики"], df["показы"])
+    t_vector = time.perf_counter() - t0
+
+    np.testing.assert_array_equal(coverage.to_numpy(dtype=float), old_coverage.to_numpy())
+    np.testing.assert_array_equal(ctr.to_numpy(dtype=float), old_ctr.to_numpy())
+
+    print(f"строк: {n_rows}")
+    print(f"построчно:       {t_legacy:8.3f} с")
+    print(f"векторизованно:  {t_vector:8.3f} с")
+    print(f"ускорение:       {t_legacy / t_vector:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Сравнение построчной раскладки бюджета/KPI по неделям (как в geo.py до векторизации)
+с векторизованной pacing.allocate_weekly.
+
+Запуск: python benchmarks/bench_pacing.py [число строк]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pacing import allocate_weekly  # noqa: E402
+
+BUDGET_COL = 'Общая стоимость с учетом НДС и АК'
+
+
+def make_plan(n_rows, seed=0):
+    """Синтетический медиаплан: n_rows площадок с периодами до 12 месяцев."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, n_rows), unit='D')
+    end = start + pd.to_timedelta(rng.integers(0, 365, n_rows), unit='D')
+    return pd.DataFrame({
+        'Название сайта': [f'site_{i}' for i in range(n_rows)],
+        'Категория': rng.choice(['Тематические площадки', 'Охватное размещение'], n_rows),
+        BUDGET_COL: rng.uniform(10_000, 5_000_000, n_rows).round(2),
+        'KPI прогноз': rng.integers(0, 500, n_rows),
+        'Start Date': start,
+        'End Date': end,
+    })
+
+
+def legacy_weeks(row, value_col, rounded):
+    """Построчный расчет из geo.py (calculate_budget_per_week / calculate_kpi_per_week)."""
+    start_date = row['Start Date']
+    end_date = row['End Date']
+    first_monday = start_date - pd.Timedelta(days=start_date.weekday())
+    last_sunday = end_date + pd.Timedelta(days=(6 - end_date.weekday()))
+    weeks = []
+    week_start = first_monday
+    while week_start <= last_sunday:
+        week_end = week_start + pd.Timedelta(days=6)
+        active_start = max(week_start, start_date)
+        active_end = min(week_end, end_date)
+        active_days = (active_end - active_start).days + 1
+        total_days = (end_date - start_date).days + 1
+        value = row[value_col] * (active_days / total_days) if active_days > 0 else 0
+        weeks.append((week_start, week_end, round(value) if rounded else value))
+        week_start += pd.Timedelta(days=7)
+    return weeks
+
+
+def legacy(df):
+    budget_data = []
+    for _, row in df.iterrows():
+        budget_data.extend(legacy_weeks(row, BUDGET_COL, False))
+    df_week_budget = pd.DataFrame(budget_data, columns=['Неделя с', 'Неделя по', 'Бюджет на неделю'])
+    df_week_budget['Категория'] = np.repeat(
+        df['Категория'].values, [len(legacy_weeks(row, BUDGET_COL, False)) for _, row in df.iterrows()])
+
+    kpi_data = []
+    for _, row in df.iterrows():
+        kpi_data.extend(legacy_weeks(row, 'KPI прогноз', True))
+    df_week_kpi = pd.DataFrame(kpi_data, columns=['Неделя с', 'Неделя по', 'KPI на неделю'])
+    return df_week_budget, df_week_kpi
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    df = make_plan(n_rows)
+
+    t0 = time.perf_counter()
+    old_budget, old_kpi = legacy(df)
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    weekly = allocate_weekly(df, BUDGET_COL)
+    t_vector = time.perf_counter() - t0
+
+    np.testing.assert_allclose(weekly['Бюджет на неделю'].to_numpy(), old_budget['Бюджет на неделю'].to_numpy())
+    np.testing.assert_array_equal(weekly['KPI на неделю'].to_numpy(), old_kpi['KPI на неделю'].to_numpy())
+    assert (weekly['Неделя с'].to_numpy() == old_budget['Неделя с'].to_numpy()).all()
+    assert (weekly['Категория'].to_numpy() == old_budget['Категория'].to_numpy()).all()
+
+    print(f"строк МП: {n_rows}, строк-недель: {len(weekly)}")
+    print(f"построчно:       {t_legacy:8.3f} с")
+    print(f"векторизованно:  {t_vector:8.3f} с")
+    print(f"ускорение:       {t_legacy / t_vector:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
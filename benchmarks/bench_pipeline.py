@@ -0,0 +1,189 @@
+"""
+Поэтапный бенчмарк конвейера отчетов на синтетических данных разного объема.
+
+Этапы:
+  header_detection   — поиск строки заголовка и разбор листа (excel_io.read_with_header), медиаплан + UTM
+  date_parsing       — разбор 'Период', категорий и KPI медиаплана (geo_report.prepare_media_plan)
+  weekly_allocation  — раскладка бюджета/KPI по неделям (geo_report.weekly_plan)
+  utm_aggregation    — фильтр arwm и взвешенная сводка UTM (geo_report.filter_utm + summarize_utm)
+  process_data       — обработка выгрузки площадки (campaign_data.process_data)
+  plan_fact_transfer — перенос плана по дням и сверка план/факт для PLAN_FACT_UPLOADS РК
+                       (campaign_data.combine_stats + attach_plan + discrepancy_matrix)
+
+Результат — JSON (версия кода, окружение, лучшее время каждого этапа по размерам),
+который можно сравнить с прошлым прогоном через --compare.
+
+Запуск:
+  python benchmarks/bench_pipeline.py --sizes 100 1000 10000 -o results.json
+  python benchmarks/bench_pipeline.py --sizes 1000000 --stages weekly_allocation utm_aggregation
+  python benchmarks/bench_pipeline.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from campaign_data import attach_plan, combine_stats, daily_plan, discrepancy_matrix, process_data  # noqa: E402
+from excel_io import read_with_header  # noqa: E402
+from generators import (MP_BUDGET_COL, make_matching_rows, make_media_plan, make_platform_export,  # noqa: E402
+                        make_utm_export, write_xlsx)
+from geo_report import filter_utm, prepare_media_plan, summarize_utm, weekly_plan  # noqa: E402
+
+STAGES = ['header_detection', 'date_parsing', 'weekly_allocation', 'utm_aggregation',
+          'process_data', 'plan_fact_transfer']
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+
+# На сколько РК делится выгрузка площадки в этапе plan_fact_transfer
+PLAN_FACT_UPLOADS = 20
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _timeit(func, repeat):
+    """Лучшее из repeat запусков (секунды) и результат последнего запуска."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+class Inputs:
+    """Входные данные одного размера; .xlsx создаются только для этапа header_detection."""
+
+    def __init__(self, n_rows, workdir, seed=0):
+        self.n_rows = n_rows
+        self.workdir = workdir
+        self.seed = seed
+        self.media_plan = make_media_plan(n_rows, seed).iloc[:, 1:]
+        self.utm, self.utm_title = make_utm_export(n_rows, seed)
+        self.platform = make_platform_export(n_rows, seed)
+
+    def xlsx_paths(self):
+        mp_path = os.path.join(self.workdir, f'mp_{self.n_rows}_{self.seed}.xlsx')
+        utm_path = os.path.join(self.workdir, f'utm_{self.n_rows}_{self.seed}.xlsx')
+        if not os.path.exists(mp_path):
+            write_xlsx(mp_path, make_media_plan(self.n_rows, self.seed), preamble=[['Медиаплан']])
+        if not os.path.exists(utm_path):
+            write_xlsx(utm_path, self.utm, preamble=[[self.utm_title]])
+        return mp_path, utm_path
+
+
+def run_stage(stage, inputs, repeat):
+    """Время одного этапа; подготовка входа этапа в замер не входит."""
+    if stage == 'header_detection':
+        mp_path, utm_path = inputs.xlsx_paths()
+        return _timeit(lambda: (read_with_header(mp_path, '№'), read_with_header(utm_path, 'UTM Source')), repeat)[0]
+
+    if stage == 'date_parsing':
+        return _timeit(lambda: prepare_media_plan(inputs.media_plan, MP_BUDGET_COL), repeat)[0]
+
+    if stage == 'weekly_allocation':
+        df, _ = prepare_media_plan(inputs.media_plan, MP_BUDGET_COL)
+        df[MP_BUDGET_COL] = pd.to_numeric(df[MP_BUDGET_COL], errors='coerce').fillna(0)
+        return _timeit(lambda: weekly_plan(df, MP_BUDGET_COL), repeat)[0]
+
+    if stage == 'utm_aggregation':
+        return _timeit(lambda: summarize_utm(filter_utm(inputs.utm)), repeat)[0]
+
+    if stage == 'process_data':
+        return _timeit(lambda: process_data(inputs.platform.copy()), repeat)[0]
+
+    if stage == 'plan_fact_transfer':
+        df, col_map, _ = process_data(inputs.platform.copy())
+        frames, matches = {}, {}
+        for k, rows in enumerate(np.array_split(np.arange(len(df)), PLAN_FACT_UPLOADS)):
+            campaign = f"РК {k}"
+            start_date = df['дата'].min() + pd.Timedelta(days=10)
+            frames[campaign] = (df.iloc[rows], col_map)
+            matches[campaign] = (make_matching_rows(seed=inputs.seed + k), start_date,
+                                 (df['дата'].max() - start_date).days + 1)
+        return _timeit(lambda: discrepancy_matrix(attach_plan(combine_stats(frames), daily_plan(matches))), repeat)[0]
+
+    raise ValueError(f"Неизвестный этап: {stage}")
+
+
+def run(sizes, stages, repeat, workdir):
+    results = []
+    for n_rows in sizes:
+        inputs = Inputs(n_rows, workdir)
+        for stage in stages:
+            seconds = run_stage(stage, inputs, repeat)
+            results.append({'stage': stage, 'rows': n_rows, 'seconds': round(seconds, 6),
+                            'rows_per_second': round(n_rows / seconds) if seconds > 0 else None})
+            print(f"{stage:<20} {n_rows:>9} строк  {seconds * 1000:>10.1f} мс", file=sys.stderr)
+    return {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(old_path, new_path):
+    """Печатает ускорение/замедление каждого этапа между двумя JSON-результатами."""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    old_times = {(r['stage'], r['rows']): r['seconds'] for r in old['results']}
+    print(f"{'этап':<20} {'строк':>9} {old['revision'] or 'old':>12} {new['revision'] or 'new':>12}  изменение")
+    for r in new['results']:
+        before = old_times.get((r['stage'], r['rows']))
+        if before is None:
+            continue
+        ratio = before / r['seconds'] if r['seconds'] > 0 else float('inf')
+        print(f"{r['stage']:<20} {r['rows']:>9} {before * 1000:>10.1f}мс {r['seconds'] * 1000:>10.1f}мс  x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поэтапный бенчмарк конвейера отчетов")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="число строк (от 100 до 1 000 000)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=3, help="число запусков этапа, берется лучшее время")
+    parser.add_argument('--workdir', default=None, help="папка для сгенерированных .xlsx (по умолчанию временная)")
+    parser.add_argument('-o', '--output', default=None, help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="сравнить два JSON-результата")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        report = run(args.sizes, args.stages, args.repeat, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            report = run(args.sizes, args.stages, args.repeat, workdir)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Сравнение движков чтения .xlsx (excel_io) на выгрузках типичного размера (5–50 МБ).
+
+Для каждого файла и каждого доступного движка замеряются:
+  header  — поиск строки заголовка с остановкой на ней (locate_header(header_only=True))
+  sheet   — весь лист с поиском заголовка (read_with_header)
+  columns — три столбца всего листа (read_sheet(usecols=...))
+и для сравнения pd.read_excel (openpyxl). Движок, который выбрал бы choose_backend, отмечен «*».
+
+Запуск: python benchmarks/bench_readers.py [размеры в МБ ...] [--repeat N] [-o results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_io import available_backends, choose_backend, locate_header, read_sheet, read_with_header  # noqa: E402
+from generators import make_utm_export, write_xlsx  # noqa: E402
+
+DEFAULT_SIZES_MB = [5, 20, 50]
+
+# Примерный объем строки выгрузки UTM в .xlsx (байт), чтобы попасть в заданный размер файла
+BYTES_PER_UTM_ROW = 55
+
+
+def make_export(path, size_mb, seed=0):
+    """Выгрузка UTM размером около size_mb МБ."""
+    df, title = make_utm_export(int(size_mb * 2**20 / BYTES_PER_UTM_ROW), seed)
+    write_xlsx(path, df, preamble=[[title]])
+    return len(df)
+
+
+def _best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_file(path, repeat):
+    tasks = {
+        'header': lambda backend: locate_header(path, 'UTM Source', backend=backend, header_only=True),
+        'sheet': lambda backend: read_with_header(path, 'UTM Source', backend=backend),
+        'columns': lambda backend: read_sheet(path, usecols=[0, 1, 3], backend=backend),
+    }
+    results = []
+    for task, func in tasks.items():
+        chosen = choose_backend(path, task)
+        for backend in available_backends():
+            results.append({'task': task, 'backend': backend, 'chosen': backend == chosen,
+                            'seconds': round(_best(lambda: func(backend), repeat), 4)})
+    results.append({'task': 'sheet', 'backend': 'pd.read_excel', 'chosen': False,
+                    'seconds': round(_best(lambda: pd.read_excel(path, header=1), repeat), 4)})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение движков чтения .xlsx")
+    parser.add_argument('sizes', type=float, nargs='*', default=DEFAULT_SIZES_MB, help="размеры файлов в МБ")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('-o', '--output', default=None, help="файл для JSON с результатами")
+    args = parser.parse_args(argv)
+
+    report = {'backends': available_backends(), 'files': []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size_mb in args.sizes:
+            path = os.path.join(workdir, f'utm_{size_mb}mb.xlsx')
+            n_rows = make_export(path, size_mb)
+            actual_mb = os.path.getsize(path) / 2**20
+            print(f"\nФайл {actual_mb:.1f} МБ, {n_rows} строк")
+            results = bench_file(path, args.repeat)
+            for r in results:
+                mark = '*' if r['chosen'] else ' '
+                print(f"  {r['task']:<8} {r['backend']:<16}{mark} {r['seconds']:>8.3f} с")
+            report['files'].append({'size_mb': round(actual_mb, 1), 'rows': n_rows, 'results': results})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
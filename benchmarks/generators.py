@@ -0,0 +1,135 @@
+"""
+Генераторы синтетических входных данных для бенчмарков:
+  - медиаплан ГЕО (строки-разделы категорий, площадки, 'Период', заглушки '-')
+  - выгрузка UTM из Метрики (A1 'Отчет за период с …', кампании arwm)
+  - ежедневная выгрузка статистики площадки для stata.py
+
+Таблицы строятся векторно, запись в .xlsx — через openpyxl в режиме write_only,
+поэтому генерация масштабируется до миллиона строк.
+"""
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+MP_BUDGET_COL = 'Общая стоимость с учетом НДС и АК'
+
+CATEGORIES = ['Тематические площадки', 'Охватное размещение', 'Программатик']
+UTM_SOURCES = ['yandex', 'vk', 'mytarget', 'cian', 'avito', 'domclick', 'yandex_maps', 'navigator']
+UTM_MEDIUMS = ['cpm', 'cpc', 'banner', 'video']
+
+
+def make_media_plan(n_rows, seed=0, year=2025):
+    """
+    Медиаплан из n_rows площадок: перед каждым блоком площадок — строка раздела
+    (название категории в '№'), в числовых столбцах встречаются заглушки '-'.
+    Столбцы как в выгрузке ГЕО: пустой первый столбец, '№', 'Название сайта', 'Период', бюджет, 'KPI прогноз'.
+    """
+    rng = np.random.default_rng(seed)
+    month = rng.integers(1, 13, n_rows)
+    start_day = rng.integers(1, 15, n_rows)
+    length = rng.integers(7, 45, n_rows)
+    start = pd.to_datetime({'year': np.full(n_rows, year), 'month': month, 'day': start_day})
+    end = start + pd.to_timedelta(length, unit='D')
+    period = start.dt.strftime('%d.%m.%Y') + ' - ' + end.dt.strftime('%d.%m.%Y')
+
+    budget = rng.uniform(10_000, 2_000_000, n_rows).round(2).astype(object)
+    kpi = rng.integers(0, 300, n_rows).astype(object)
+    budget[rng.random(n_rows) < 0.02] = '-'
+    kpi[rng.random(n_rows) < 0.05] = '-'
+
+    sites = pd.DataFrame({
+        '': None,
+        '№': np.arange(1, n_rows + 1),
+        'Название сайта': [f'site_{i}.ru' for i in range(n_rows)],
+        'Период': period,
+        MP_BUDGET_COL: budget,
+        'KPI прогноз': kpi,
+    })
+
+    # Строка раздела перед каждым блоком из ~50 площадок
+    block = np.arange(n_rows) // 50
+    first_in_block = np.flatnonzero(np.r_[True, block[1:] != block[:-1]])
+    sections = pd.DataFrame({
+        '': None,
+        '№': [CATEGORIES[b % len(CATEGORIES)] for b in block[first_in_block]],
+        'Название сайта': None, 'Период': None, MP_BUDGET_COL: None, 'KPI прогноз': None,
+    }, index=first_in_block - 0.5)
+    sites.index = sites.index.astype(float)
+    return pd.concat([sites, sections]).sort_index().reset_index(drop=True)
+
+
+def make_utm_export(n_rows, seed=0, period=('2025-02-03', '2025-02-09')):
+    """
+    Выгрузка UTM из Метрики: n_rows строк, ~70 % кампаний содержат 'arwm'.
+    Время на сайте — строка 'Ч:ММ:СС', доли — числа от 0 до 1.
+    Возвращает (таблица, строка A1 с отчетным периодом).
+    """
+    rng = np.random.default_rng(seed)
+    visits = rng.integers(1, 5_000, n_rows)
+    seconds = rng.integers(0, 600, n_rows)
+    campaign = np.where(rng.random(n_rows) < 0.7, 'arwm_', 'brand_') + rng.integers(0, 500, n_rows).astype(str)
+    df = pd.DataFrame({
+        'UTM Source': rng.choice(UTM_SOURCES, n_rows),
+        'UTM Campaign': campaign,
+        'UTM Medium': rng.choice(UTM_MEDIUMS, n_rows),
+        'Визиты': visits,
+        'Посетители': (visits * rng.uniform(0.6, 1.0, n_rows)).astype(int),
+        'Отказы': rng.uniform(0, 0.6, n_rows).round(4),
+        'Глубина просмотра': rng.uniform(1, 3, n_rows).round(2),
+        'Роботность': rng.uniform(0, 0.2, n_rows).round(4),
+        'Время на сайте': [f"{s // 3600}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in seconds],
+    })
+    return df, f"Отчет за период с {period[0]} по {period[1]}"
+
+
+def make_platform_export(n_rows, seed=0, as_text=True, start='2025-01-01'):
+    """
+    Ежедневная статистика площадки (как в Google-таблице или Excel площадки):
+    'Дата' в формате ДД.ММ.ГГГГ, показы, клики, охват, расход.
+    При as_text=True числа записаны строками с пробелами-разделителями и запятой ('12 345,67'),
+    как их отдает CSV-выгрузка Google-таблиц; охват иногда задан долей.
+    """
+    rng = np.random.default_rng(seed)
+    impressions = rng.integers(0, 200_000, n_rows)
+    clicks = (impressions * rng.uniform(0.001, 0.02, n_rows)).astype(int)
+    reach = np.where(rng.random(n_rows) < 0.1, rng.uniform(0, 1, n_rows).round(4),
+                     (impressions * rng.uniform(0.3, 0.9, n_rows)).round())
+    spend = (impressions * rng.uniform(0.05, 0.3, n_rows)).round(2)
+    dates = pd.Timestamp(start) + pd.to_timedelta(np.arange(n_rows) % 366, unit='D')
+    df = pd.DataFrame({
+        'Дата': dates.strftime('%d.%m.%Y'),
+        'Показы': impressions,
+        'Клики': clicks,
+        'Охват': reach,
+        'Расход': spend,
+    })
+    if as_text:
+        for col in ['Показы', 'Клики', 'Расход']:
+            df[col] = [f"{v:,.2f}".replace(',', ' ').replace('.', ',') for v in df[col]]
+        df['Охват'] = df['Охват'].astype(str).str.replace('.', ',', regex=False)
+    return df
+
+
+def make_matching_rows(site='site_0.ru', seed=0):
+    """Строка медиаплана, найденная для РК (вход campaign_data.daily_plan): плановые показатели и бюджет."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'площадка': [site],
+        'показы план': [float(rng.integers(1_000_000, 50_000_000))],
+        'клики план': [float(rng.integers(1_000, 100_000))],
+        'охват': [float(rng.integers(100_000, 5_000_000))],
+        'бюджет с ндс и ак': [float(rng.uniform(100_000, 5_000_000))],
+    })
+
+
+def write_xlsx(path, df, preamble=()):
+    """Записывает таблицу в .xlsx потоково (write_only): сначала строки preamble, затем заголовок и данные."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for row in preamble:
+        ws.append(list(row))
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append([None if isinstance(v, float) and np.isnan(v) else v for v in row])
+    wb.save(path)
+    return path
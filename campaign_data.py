@@ -0,0 +1,319 @@
+"""
+Обработка выгрузок статистики площадок (Excel / Google-таблицы) без привязки к интерфейсу:
+приведение столбцов, числа, охват, CTR, перенос плана из медиаплана по дням
+и сверка плана с фактом сразу по всем РК.
+Используется stata.py и бенчмарками.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from column_schema import ColumnSchema
+from compact_dtypes import COMPACT_DTYPES, PLATFORM_STATS_PROFILE
+from excel_io import cached_read_excel, file_digest
+from numeric_parse import REPORT_COLUMNS, parse_numeric_columns
+from stage_metrics import timed
+from table_cache import TABLE_CACHE
+
+
+# Словарь для сопоставления названий колонок в отчетах
+COLUMN_MAPPING = {
+    "дата": ["дата", "date"],
+    "показы": ["показы", "импрессии", "impressions"],
+    "клики": ["клики", "clicks"],
+    "расход": ["расход", "затраты", "cost", "спенд", "расход до ндс", "расходдондс"],
+    "охват": ["охват", "reach"]
+}
+
+# Словарь для сопоставления названий колонок в МП (рекламные площадки)
+PLATFORM_MAPPING = {
+    "площадка": ["площадка", "название сайта", "ресурс"]
+}
+
+
+# Схемы ролей столбцов: слова компилируются в регулярные выражения один раз,
+# а разбор каждого нового заголовка запоминается
+REPORT_SCHEMA = ColumnSchema("статистика площадки", COLUMN_MAPPING, required=("дата", "показы"))
+PLATFORM_SCHEMA = ColumnSchema("площадки медиаплана", PLATFORM_MAPPING, required=("площадка",))
+MP_FILTER_SCHEMA = ColumnSchema("столбцы медиаплана", {
+    "дата": ["дата"],
+    "площадка": ["площадка", "название сайта", "ресурс"],
+    "показы": ["показ"],
+    "клики": ["клик"],
+    "охват": ["охват"],
+    "расход": ["расход"],
+    "бюджет": [re.compile(r".* ндс и .*")],
+})
+MP_VALUE_SCHEMA = ColumnSchema("значения медиаплана", {"показы": ["показы"], "ндс": ["ндс"]})
+CAMPAIGN_PERIOD_SCHEMA = ColumnSchema("период РК", {"дата": ["дата"], "показы": ["показ"]}, required=("дата", "показы"))
+
+
+def standardize_columns(df, schema):
+    """
+    Приводит названия колонок к стандартному виду по схеме ролей (column_schema.ColumnSchema).
+    Все имена столбцов приводятся к нижнему регистру и обрезаются пробелы.
+    Столбцы с заголовком 'nan' удаляются. Разбор заголовка известного формата берется из кэша схемы.
+    """
+    resolution = schema.resolve(df.columns)
+    df.columns = resolution["normalized"]
+    df = df.loc[:, df.columns != 'nan']
+
+    column_map = {role: resolution["normalized"][resolution["by_role"][role]]
+                  for role in schema.patterns if role in resolution["by_role"]}
+
+    return df.rename(columns=column_map), column_map
+
+
+def filter_columns(df, is_mp=False):
+    """
+    Оставляет только нужные столбцы в определенном порядке.
+    Фильтрация применяется только к файлам медиаплана (если is_mp=True).
+    - дата (если есть)
+    - площадка (если есть)
+    - показы (если есть)
+    - клики (если есть)
+    - охват (если есть)
+    - расход (если есть)
+    - столбец, содержащий "с учетом НДС и АК" (если есть)
+    """
+    # Если это медиаплан, применяем фильтрацию
+    if is_mp:
+        # Заменяем все символы "-" и значения NaN и None на 0
+        df.replace({"-": 0}, inplace=True)  # Заменяем "-" на 0
+        df.fillna(0, inplace=True)  # Заменяем NaN и None на 0
+
+        # Оставляем столбцы, получившие роль по схеме MP_FILTER_SCHEMA
+        roles = MP_FILTER_SCHEMA.resolve(df.columns)["roles"]
+        required_columns = [col for col, role in zip(df.columns, roles) if role is not None]
+
+        # Возвращаем DataFrame с колонками в нужном порядке
+        return df[required_columns] if required_columns else df
+
+    # Если это не медиаплан (например, отчет), возвращаем df без изменений
+    return df
+
+
+def adjust_coverage(coverage, impressions):
+    """
+    Корректирует охват сразу для всего столбца:
+      - пустой или нулевой охват -> 0
+      - доля меньше 1 с тремя и более знаками после запятой (например, 0.002) считается процентом и умножается на 100
+      - если показов больше чем в 10 раз больше охвата, охват = показы * охват
+      - иначе охват округляется до целого
+    """
+    # Убеждаемся, что охват — это число (строки вида "0,25" приводим к 0.25)
+    if not pd.api.types.is_numeric_dtype(coverage):
+        coverage = pd.to_numeric(coverage.astype(str).str.replace(",", "."), errors="coerce")
+    coverage = coverage.astype(float)
+    impressions = pd.to_numeric(impressions, errors="coerce").astype(float)
+
+    # Больше двух знаков после запятой <=> число не совпадает со своим округлением до сотых
+    is_percent = (coverage > 0) & (coverage < 1) & (coverage.round(2) != coverage)
+    coverage = coverage.where(~is_percent, coverage * 100)
+
+    # Коррекция данных (если покрытие не должно быть в 10 раз меньше показов)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        needs_scaling = (coverage > 0) & (impressions > 0) & (impressions / coverage > 10)
+    adjusted = np.where(needs_scaling, impressions * coverage, coverage.round())
+
+    return pd.Series(np.where(coverage.isna() | (coverage == 0), 0, adjusted), index=coverage.index)
+
+
+def safe_divide(numerator, denominator):
+    """Поэлементное деление, дающее 0 там, где знаменатель не больше нуля."""
+    denominator = denominator.where(denominator > 0)
+    return pd.Series(np.where(denominator.notna(), numerator / denominator, 0), index=numerator.index)
+
+
+@timed("process_data")
+def process_data(df):
+    """
+    Обрабатывает загруженные данные (Excel или Google-таблицы):
+      - Стандартизирует имена колонок
+      - Преобразует дату, приводит числовые значения к нужному типу
+      - Рассчитывает расход с НДС и CTR
+      - Очищает ненужные столбцы
+    Возвращает (df, col_map, numeric_report) — numeric_report: отчет parse_numeric_columns
+    о разобранных и нераспознанных значениях числовых столбцов.
+    """
+    df, col_map = standardize_columns(df, REPORT_SCHEMA)
+    df.fillna(0, inplace=True)
+
+    # Преобразуем дату в формат datetime
+    if "дата" in col_map:
+        df[col_map["дата"]] = pd.to_datetime(df[col_map["дата"]], format="%d.%m.%Y", errors="coerce")
+
+    # Приведение к числовому типу за один проход (числовые столбцы не разбираются повторно)
+    df, numeric_report = parse_numeric_columns(
+        df, [col_map[key] for key in ["показы", "клики", "охват", "расход"] if key in col_map])
+
+    # Корректировка охвата
+    if "охват" in col_map and "показы" in col_map:
+        df["охват"] = adjust_coverage(df[col_map["охват"]], df[col_map["показы"]])
+
+    # Расчет расхода с НДС
+    if "расход" in col_map and "расход с ндс" not in df.columns:
+        df["расход с ндс"] = df[col_map["расход"]] * 1.2
+
+    # Расчет CTR
+    if "клики" in col_map and "показы" in col_map and "ctr" not in df.columns:
+        df["ctr"] = safe_divide(df[col_map["клики"]], df[col_map["показы"]])
+
+    # Фильтрация нужных столбцов
+    df = filter_columns(df)
+
+    return df, col_map, numeric_report
+
+
+def load_platform_stats(file, sheet_name=0, compact=None):
+    """
+    Лист выгрузки площадки из Excel после process_data через дисковый кэш таблиц:
+    повторная загрузка того же файла не читает Excel.
+    compact — хранить таблицу в компактных типах (PLATFORM_STATS_PROFILE), по умолчанию COMPACT_DTYPES.
+    Возвращает (df, col_map, numeric_report).
+    """
+    compact = COMPACT_DTYPES if compact is None else compact
+
+    def build():
+        df, col_map, numeric_report = process_data(cached_read_excel(file, sheet_name=sheet_name))
+        extra = {'col_map': col_map, 'numeric': numeric_report.to_dict('records')}
+        if compact:
+            df, extra['memory'] = PLATFORM_STATS_PROFILE.compact(df)
+        return df, extra
+    key = (file_digest(file), 'platform_stats', sheet_name) + (('compact',) if compact else ())
+    df, extra = TABLE_CACHE.get_or_build(key, build)
+    PLATFORM_STATS_PROFILE.record(f"{getattr(file, 'name', file)} / {sheet_name}", extra.get('memory'))
+    return df, extra['col_map'], pd.DataFrame(extra['numeric'], columns=REPORT_COLUMNS)
+
+
+# Плановые столбцы (в день) и соответствующие им фактические столбцы статистики
+PLAN_FACT_COLUMNS = {
+    "показы план": "показы",
+    "клики план": "клики",
+    "охват план": "охват",
+    "бюджет план": "расход с ндс",
+}
+
+# В сверке плана и факта учитываются только дни, где факт больше этого значения
+FACT_MIN_VALUE = 10
+
+# Расхождение (в процентах), до которого план считается выполненным
+DIFF_TOLERANCE_PERCENT = 1
+
+# Столбец с названием РК в общей таблице статистики
+CAMPAIGN_COL = "рк"
+
+
+def plan_column_name(col):
+    """Плановый столбец для числового столбца строки медиаплана или None, если столбец не плановый."""
+    col = col.lower()
+    if "ндс" in col:
+        return "бюджет план"
+    if "показы" in col and "план" in col:
+        return "показы план"
+    if "клики" in col and "план" in col:
+        return "клики план"
+    if "охват" in col:
+        return "охват план"
+    return None
+
+
+def combine_stats(frames):
+    """
+    Склеивает статистику всех загруженных РК ({РК: (df, col_map)}) в одну таблицу
+    со стандартными именами столбцов и столбцом CAMPAIGN_COL.
+    Индекс — (РК, индекс строки в исходной таблице), поэтому результат раскладывается обратно через xs.
+    """
+    stats = pd.concat({campaign: df.rename(columns={v: k for k, v in col_map.items()})
+                       for campaign, (df, col_map) in frames.items()},
+                      names=["загрузка", "строка"])
+    stats[CAMPAIGN_COL] = stats.index.get_level_values(0)
+    stats["дата"] = pd.to_datetime(stats["дата"], errors="coerce")
+    return stats
+
+
+def daily_plan(matches):
+    """
+    Плановые показатели в день для всех РК одной таблицей.
+    matches — {РК: (найденные строки медиаплана, дата начала РК, число дней РК)}.
+    Берется первая найденная строка; плановые столбцы делятся на число дней РК.
+    """
+    rows = []
+    for campaign, (matching_rows, start_date, campaign_days) in matches.items():
+        if matching_rows is None or start_date is None or campaign_days <= 0:
+            continue
+        numeric = matching_rows.select_dtypes(include="number")
+        row = {CAMPAIGN_COL: campaign, "начало": start_date, "дней": campaign_days}
+        for col in numeric.columns:
+            plan_col = plan_column_name(col)
+            if plan_col is not None and plan_col not in row:
+                row[plan_col] = numeric[col].iloc[0]
+        rows.append(row)
+
+    plan = pd.DataFrame(rows, columns=[CAMPAIGN_COL, "начало", "дней", *PLAN_FACT_COLUMNS])
+    plan_cols = list(PLAN_FACT_COLUMNS)
+    plan[plan_cols] = plan[plan_cols].astype(float).div(plan["дней"].astype(float), axis=0)
+    return plan
+
+
+def attach_plan(stats, plan):
+    """
+    Добавляет к дневной статистике всех РК плановые столбцы одним слиянием по РК.
+    До даты начала РК план равен 0; у РК без найденной строки медиаплана план пустой (NaN).
+    """
+    plan_cols = list(PLAN_FACT_COLUMNS)
+    merged = stats.drop(columns=[col for col in plan_cols if col in stats.columns]).merge(
+        plan, on=CAMPAIGN_COL, how="left")
+    merged.index = stats.index
+
+    before_start = (merged["дата"] < merged["начало"]).to_numpy()[:, None]
+    merged[plan_cols] = merged[plan_cols].mask(before_start & merged[plan_cols].notna().to_numpy(), 0)
+    return merged.drop(columns=["начало", "дней"])
+
+
+def discrepancy_matrix(planned):
+    """
+    Сводная таблица расхождений план/факт по всем РК: строка — РК, столбцы — (показатель, величина).
+    Суммы считаются только по дням, где факт больше FACT_MIN_VALUE; показатели без плана у РК пустые.
+    """
+    campaigns = planned[CAMPAIGN_COL]
+    blocks = {}
+    for plan_col, fact_col in PLAN_FACT_COLUMNS.items():
+        if plan_col not in planned.columns or fact_col not in planned.columns:
+            continue
+        counted = planned[fact_col] > FACT_MIN_VALUE
+        totals = pd.DataFrame({
+            "Факт": planned[fact_col].where(counted, 0),
+            "План": planned[plan_col].where(counted, 0),
+        }).groupby(campaigns, sort=False).sum()
+        has_plan = planned[plan_col].notna().groupby(campaigns, sort=False).any()
+
+        plan_total = totals["План"].where(totals["План"] > 0)
+        totals["Разница"] = (totals["Факт"] - plan_total).fillna(0)
+        totals["Расхождение, %"] = (totals["Разница"] / plan_total * 100).fillna(0)
+        blocks[fact_col] = totals[has_plan]
+
+    if not blocks:
+        return pd.DataFrame()
+    matrix = pd.concat(blocks, axis=1)
+    matrix.index.name = "РК"
+    return matrix.loc[matrix.notna().any(axis=1)]
+
+
+def discrepancy_warnings(matrix):
+    """Сообщения о расхождениях по каждой РК из discrepancy_matrix: {РК: [сообщения]}."""
+    warnings = {}
+    for campaign, row in matrix.iterrows():
+        messages = warnings.setdefault(campaign, [])
+        for fact_col in row.index.get_level_values(0).unique():
+            values = row[fact_col]
+            if pd.isna(values["План"]):
+                continue
+            if values["План"] <= 0:
+                messages.append(f"✅ Нет данных по {fact_col} для расхождения.")
+            elif abs(values["Расхождение, %"]) > DIFF_TOLERANCE_PERCENT:
+                messages.append(f"⚠️ Разница по {fact_col}: {values['Разница']:+.0f} ({values['Расхождение, %']:+.2f}%)")
+            else:
+                messages.append(f"✅ Нет значительных расхождений по {fact_col}.")
+    return warnings
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+# Сколько пар графиков (PNG) хранится в памяти, общий кэш для всех сессий
+CHART_CACHE_MAX = 256
+
+# Столбцы, от которых зависит вид графиков
+CHART_COLUMNS = ["дата_график", "показы", "охват", "показы план", "клики", "клики план"]
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_pool = None
+
+
+def _render_campaign_charts(data, campaign_name):
+    """
+    Рисует графики «Показы и охват» и «Клики» по дням и возвращает их как PNG.
+    Выполняется в отдельном процессе, поэтому получает данные простыми списками.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    dates = data["дата_график"]
+
+    # График показов и охвата
+    fig = plt.figure(figsize=(10, 6))
+    if "показы" in data:
+        plt.plot(dates, data["показы"], marker='o', label="Показы", color='b')
+    if "охват" in data:
+        plt.plot(dates, data["охват"], marker='o', label="Охват", color='g')
+    if "показы план" in data:
+        plt.plot(dates, data["показы план"], linestyle='--', color='orange', linewidth=2, label="Показы по плану")
+    if "охват" in data:
+        plt.fill_between(dates, 0, data["охват"], color='g', alpha=0.2)
+    plt.title(f"Показы и Охват по дням для {campaign_name}")
+    plt.xticks(rotation=45)
+    plt.grid(True)
+    plt.legend()
+    impressions_png = io.BytesIO()
+    fig.savefig(impressions_png, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+
+    # График кликов
+    fig = plt.figure(figsize=(10, 3))
+    if "клики" in data:
+        plt.bar(dates, data["клики"], color='r', alpha=0.7, label="Клики")
+    if "клики план" in data:
+        plt.bar(dates, data["клики план"], color='orange', alpha=0.5, label="Клики по плану")
+    plt.title(f"Клики по дням для {campaign_name}")
+    plt.xticks(rotation=45)
+    plt.grid(True, axis='y')
+    plt.legend()
+    clicks_png = io.BytesIO()
+    fig.savefig(clicks_png, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+
+    return impressions_png.getvalue(), clicks_png.getvalue()
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _lock:
+        _pool = None
+
+
+def chart_key(df, campaign_name, start_date, end_date):
+    """Ключ кэша: хэш отображаемых данных, периода, названия РК и набора плановых столбцов."""
+    columns = [col for col in CHART_COLUMNS if col in df.columns]
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df[columns], index=False).values.tobytes())
+    digest.update(repr((campaign_name, str(start_date), str(end_date), tuple(columns))).encode())
+    return digest.hexdigest()
+
+
+def _remember(key, future):
+    if future.exception() is None:
+        with _lock:
+            _cache[key] = future.result()
+            while len(_cache) > CHART_CACHE_MAX:
+                _cache.popitem(last=False)
+
+
+def submit_campaign_charts(df, campaign_name, start_date, end_date):
+    """
+    Запускает построение графиков РК и сразу возвращает Future с парой PNG (показы/охват, клики).
+    Если данные, период и плановые столбцы не менялись, Future уже готов и берется из кэша.
+    Рисование идет в пуле процессов, поэтому графики нескольких РК строятся параллельно.
+    """
+    key = chart_key(df, campaign_name, start_date, end_date)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            done = Future()
+            done.set_result(_cache[key])
+            return done
+
+    data = {col: df[col].tolist() for col in CHART_COLUMNS if col in df.columns}
+    try:
+        future = _get_pool().submit(_render_campaign_charts, data, campaign_name)
+    except (BrokenProcessPool, RuntimeError, OSError):
+        # Пул недоступен — рисуем в текущем процессе
+        _reset_pool()
+        future = Future()
+        future.set_result(_render_campaign_charts(data, campaign_name))
+    future.add_done_callback(lambda f: _remember(key, f))
+    return future
@@ -0,0 +1,42 @@
+"""
+Раскладка загруженных файлов по клиентам по их именам (дашборд отчетов ГЕО).
+
+Роль файла и имя клиента определяются по словам имени файла: словом считается часть
+между разделителями (пробел, '_', '-', '.'), поэтому 'мп' / 'utm' внутри названия клиента
+('Шампунь МП', 'Ampera_mp') не вырезаются и не меняют роль файла.
+"""
+import os
+import re
+
+import pandas as pd
+
+# Разделители слов в имени файла
+_SEPARATORS = r"[\s_\-.]"
+
+# Слова в имени файла, по которым он считается выгрузкой UTM, и слова, которые не входят в имя клиента
+UTM_NAME_PATTERN = re.compile(rf"(?:^|{_SEPARATORS})(?:utm|метк\w*|метрик\w*|metrika)(?=$|{_SEPARATORS})",
+                              re.IGNORECASE)
+ROLE_WORDS_PATTERN = re.compile(rf"(?:^|{_SEPARATORS})(?:utm|метки|метрика|metrika|медиаплан|мп|mp|media ?plan)"
+                                rf"(?=$|{_SEPARATORS})", re.IGNORECASE)
+
+
+def client_key(file_name):
+    """Имя клиента из имени файла: без расширения, отдельных слов «мп», «utm», «метки» и разделителей."""
+    stem = os.path.splitext(file_name)[0]
+    cleaned = ROLE_WORDS_PATTERN.sub(" ", stem)
+    return re.sub(rf"{_SEPARATORS}+", " ", cleaned).strip() or stem
+
+
+def file_role(file_name):
+    """'Метки' для CSV и файлов со словом «utm» / «метки» в имени, иначе 'Медиаплан'."""
+    stem = os.path.splitext(file_name)[0]
+    return "Метки" if file_name.lower().endswith(".csv") or UTM_NAME_PATTERN.search(stem) else "Медиаплан"
+
+
+def pair_files(file_names):
+    """Таблица клиентов для редактирования: по строке на клиента с файлами медиаплана и меток."""
+    rows = {}
+    for name in file_names:
+        rows.setdefault(client_key(name), {"Медиаплан": None, "Метки": None})[file_role(name)] = name
+    return pd.DataFrame([{"Клиент": client, **files_, "Первичные звонки": 0, "ЦО": 0}
+                         for client, files_ in sorted(rows.items())])
@@ -0,0 +1,96 @@
+"""
+Декларативные схемы ролей столбцов для выгрузок площадок и медиапланов.
+
+Схема задает для каждой роли слова (вхождение в нормализованное имя столбца) или регулярные
+выражения (re.compile). При создании схемы они компилируются в одно выражение на роль.
+Разбор заголовка — какой столбец какую роль получает — кэшируется по кортежу имен столбцов:
+выгрузки одного формата (Яндекс Директ, VK Реклама, myTarget, наш шаблон медиаплана) приходят
+с одинаковыми заголовками, и для известного заголовка разбор не повторяется.
+Если в заголовке нет обязательных ролей, diagnostic возвращает описание проблемы для интерфейса.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+# Сколько разных заголовков запоминает каждая схема
+SCHEMA_CACHE_MAX = 256
+
+
+def normalize_column(name):
+    """Имя столбца в нижнем регистре без пробелов по краям."""
+    return str(name).lower().strip()
+
+
+def _compile(patterns):
+    """Одно регулярное выражение из слов (ищутся как есть) и готовых выражений."""
+    parts = [p.pattern if isinstance(p, re.Pattern) else re.escape(p) for p in patterns]
+    return re.compile("|".join(f"(?:{part})" for part in parts))
+
+
+class ColumnSchema:
+    """
+    Роли столбцов одного вида таблиц. resolve(columns) возвращает словарь:
+      normalized — нормализованные имена столбцов (в исходном порядке);
+      roles      — роль каждого столбца по позиции (первая подходящая в порядке схемы) или None;
+      by_role    — позиция первого столбца для каждой найденной роли;
+      missing    — обязательные роли, для которых столбца нет.
+    Столбцы с пустым заголовком ('nan') ролей не получают.
+    """
+
+    def __init__(self, name, roles, required=()):
+        self.name = name
+        self.patterns = {role: _compile(patterns) for role, patterns in roles.items()}
+        self.required = tuple(required)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _resolve(self, header):
+        normalized = [normalize_column(col) for col in header]
+        roles = []
+        by_role = {}
+        for position, col in enumerate(normalized):
+            matched = [role for role, pattern in self.patterns.items() if col != "nan" and pattern.search(col)]
+            roles.append(matched[0] if matched else None)
+            for role in matched:
+                by_role.setdefault(role, position)
+        return {
+            "normalized": normalized,
+            "roles": roles,
+            "by_role": by_role,
+            "missing": [role for role in self.required if role not in by_role],
+        }
+
+    def resolve(self, columns):
+        """Роли столбцов заголовка (из кэша, если такой заголовок уже встречался)."""
+        header = tuple(str(col) for col in columns)
+        with self.lock:
+            if header in self.cache:
+                self.cache.move_to_end(header)
+                self.hits += 1
+                return self.cache[header]
+            self.misses += 1
+        resolution = self._resolve(header)
+        with self.lock:
+            self.cache[header] = resolution
+            while len(self.cache) > SCHEMA_CACHE_MAX:
+                self.cache.popitem(last=False)
+        return resolution
+
+    def column_map(self, columns):
+        """{роль: имя столбца} для таблицы с заголовком columns."""
+        columns = list(columns)
+        return {role: columns[position] for role, position in self.resolve(columns)["by_role"].items()}
+
+    def diagnostic(self, columns):
+        """Описание неизвестного формата (нет обязательных ролей) или None, если заголовок разобран."""
+        resolution = self.resolve(columns)
+        if not resolution["missing"]:
+            return None
+        return (f"Неизвестный формат ({self.name}): не найдены столбцы {', '.join(resolution['missing'])}. "
+                f"Столбцы файла: {', '.join(col for col in resolution['normalized'] if col != 'nan')}")
+
+    def summary(self):
+        """Строка со статистикой для вывода в интерфейсе."""
+        return f"Схема «{self.name}»: заголовков {len(self.cache)}, повторных {self.hits}, разборов {self.misses}"
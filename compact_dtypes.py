@@ -0,0 +1,144 @@
+"""
+Компактный профиль типов для больших таблиц: меток UTM и дневной статистики площадок.
+
+Повторяющиеся текстовые столбцы (источник, кампания, канал, площадка) хранятся как category,
+счетчики (визиты, посетители, показы, клики) и время на сайте в секундах — наименьшим подходящим
+целым типом, доли — float32. Профиль включается переменной окружения REPORT_COMPACT_DTYPES=1
+(по умолчанию выключен; значение читается в COMPACT_DTYPES при запуске приложения):
+таблицы в кэше занимают в несколько раз меньше памяти, и на одном сервере помещается больше сессий.
+Для каждой сжатой таблицы запоминается отчет о памяти по столбцам до и после преобразования.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Загружать метки и статистику площадок в компактных типах (REPORT_COMPACT_DTYPES=1 / true / yes / on)
+COMPACT_DTYPES = os.environ.get("REPORT_COMPACT_DTYPES", "").strip().lower() in ("1", "true", "yes", "on")
+
+# Текстовые столбцы не из профиля становятся category, если различных значений не больше этой доли строк
+CATEGORY_MAX_SHARE = 0.5
+
+# Сколько последних отчетов о памяти хранит каждый профиль
+MEMORY_REPORTS_MAX = 32
+
+MB = 2 ** 20
+
+
+def _category(series):
+    """Категория из строк (числа и строки вперемешку приводятся к строкам, пропуски сохраняются)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    return series.where(series.isna(), series.astype(str)).astype("category")
+
+
+def _integer(series):
+    """Наименьший целый тип; столбец с пропусками или дробными значениями остается как есть."""
+    values = pd.to_numeric(series, errors="coerce")
+    if values.isna().any() or not (values % 1 == 0).all():
+        return series
+    return pd.to_numeric(values.astype("int64"), downcast="integer")
+
+
+def _float32(series):
+    return pd.to_numeric(series, errors="coerce").astype("float32")
+
+
+_CONVERTERS = {
+    "category": _category,
+    "integer": _integer,
+    "float32": _float32,
+}
+
+
+def _is_text(series):
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+class DtypeProfile:
+    """
+    Профиль типов одного вида таблиц: {столбец: 'category' | 'integer' | 'float32'}.
+    compact(df) возвращает таблицу в компактных типах и отчет о памяти по столбцам;
+    record() запоминает отчет под именем таблицы для вывода в интерфейсе.
+    """
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = dict(columns)
+        self.reports = OrderedDict()
+        self.lock = threading.Lock()
+
+    def compact(self, df):
+        """(таблица в компактных типах, отчет) — отчет: список строк со столбцом, типами и байтами до и после."""
+        before = df.memory_usage(deep=True, index=False)
+        before_types = df.dtypes.astype(str)
+        df = df.copy()
+        for col in df.columns:
+            kind = self.columns.get(col)
+            if kind is None and _is_text(df[col]) and df[col].nunique() <= CATEGORY_MAX_SHARE * len(df):
+                kind = "category"
+            if kind is not None:
+                df[col] = _CONVERTERS[kind](df[col])
+        after = df.memory_usage(deep=True, index=False)
+        report = [{"столбец": str(col), "тип до": before_types[col], "тип после": str(df[col].dtype),
+                   "байт до": int(before[col]), "байт после": int(after[col])} for col in df.columns]
+        return df, report
+
+    def record(self, table, report):
+        """Запоминает отчет о памяти таблицы table (например, имени файла)."""
+        if not report:
+            return
+        with self.lock:
+            self.reports[table] = report
+            self.reports.move_to_end(table)
+            while len(self.reports) > MEMORY_REPORTS_MAX:
+                self.reports.popitem(last=False)
+
+    def report_frame(self, table=None):
+        """
+        Отчет о памяти: по столбцам таблицы table или, если она не указана,
+        по всем запомненным таблицам (МБ до и после и во сколько раз меньше).
+        """
+        with self.lock:
+            reports = dict(self.reports)
+        if table is not None:
+            return pd.DataFrame(reports.get(table, []))
+        rows = []
+        for name, report in reports.items():
+            before = sum(row["байт до"] for row in report) / MB
+            after = sum(row["байт после"] for row in report) / MB
+            rows.append({"таблица": name, "МБ до": round(before, 2), "МБ после": round(after, 2),
+                         "сжатие": round(before / after, 1) if after else None})
+        return pd.DataFrame(rows, columns=["таблица", "МБ до", "МБ после", "сжатие"])
+
+    def summary(self):
+        """Строка со статистикой для вывода в интерфейсе."""
+        if not COMPACT_DTYPES:
+            return f"Компактные типы «{self.name}»: выключены (REPORT_COMPACT_DTYPES)"
+        frame = self.report_frame()
+        return (f"Компактные типы «{self.name}»: таблиц {len(frame)}, "
+                f"{frame['МБ до'].sum():.1f} → {frame['МБ после'].sum():.1f} МБ")
+
+
+UTM_PROFILE = DtypeProfile("метки UTM", {
+    "UTM Source": "category",
+    "UTM Campaign": "category",
+    "UTM Medium": "category",
+    "Визиты": "integer",
+    "Посетители": "integer",
+    "Отказы": "float32",
+    "Глубина просмотра": "float32",
+    "Роботность": "float32",
+    "Время на сайте": "integer",
+})
+
+PLATFORM_STATS_PROFILE = DtypeProfile("статистика площадок", {
+    "площадка": "category",
+    "название сайта": "category",
+    "ресурс": "category",
+    "показы": "integer",
+    "клики": "integer",
+    "охват": "integer",
+    "ctr": "float32",
+})
@@ -0,0 +1,60 @@
+"""
+Длительности в формате Метрики 'Ч:ММ:СС' (время на сайте): разбор в целые секунды и обратное
+форматирование целыми столбцами, без pd.to_timedelta и построчного apply.
+Внутри отчетов время хранится в секундах; строка 'Ч:ММ:СС' получается только при выводе.
+"""
+import numpy as np
+import pandas as pd
+
+# Основной формат выгрузки Метрики: часы, затем ровно две цифры минут и секунд
+_FIXED_PATTERN = r"\d+:\d\d:\d\d"
+
+# Ч:ММ:СС с необязательными днями ('1 day 02:03:04' — так записываются длительности pandas)
+# и долями секунды (отбрасываются)
+_DURATION_PATTERN = r"^\s*(?:(\d+) days? )?(\d+):(\d{1,2}):(\d{1,2})(?:[.,]\d*)?\s*$"
+
+# Сколько неразобранных значений показывается в сообщении об ошибке
+EXAMPLES_MAX = 3
+
+
+def parse_durations(values):
+    """
+    Секунды из столбца длительностей: строки 'Ч:ММ:СС' (и значения времени из Excel), timedelta
+    или числа (уже секунды). Возвращает int64, а если есть пустые ячейки — float64 с NaN.
+    Непустое значение другого формата — ValueError с примерами.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_timedelta64_dtype(values):
+        seconds = np.floor(values.dt.total_seconds())
+    elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        seconds = values.astype("float64")
+    else:
+        text = values.astype("str").str.strip()
+        # Основной формат разбирается срезами по фиксированным позициям с конца строки
+        fixed = text.str.fullmatch(_FIXED_PATTERN).fillna(False).astype(bool)
+        seconds = pd.Series(np.nan, index=values.index)
+        if fixed.any():
+            hms = text[fixed]
+            seconds[fixed] = (hms.str.slice(0, -6).astype("int64") * 3600
+                              + hms.str.slice(-5, -3).astype("int64") * 60
+                              + hms.str.slice(-2).astype("int64")).to_numpy()
+        other = ~fixed & values.notna()
+        if other.any():
+            parts = text[other].str.extract(_DURATION_PATTERN).apply(pd.to_numeric).astype("float64")
+            seconds[other] = (parts[0].fillna(0) * 86400 + parts[1] * 3600 + parts[2] * 60 + parts[3]).to_numpy()
+        invalid = seconds.isna() & values.notna()
+        if invalid.any():
+            examples = ", ".join(f"'{value}'" for value in values[invalid].astype(str).unique()[:EXAMPLES_MAX])
+            raise ValueError(f"Время не в формате Ч:ММ:СС: {examples}")
+    return seconds.astype("int64") if seconds.notna().all() else seconds
+
+
+def format_durations(seconds):
+    """Столбец секунд в строки 'Ч:ММ:СС' (доли секунды отбрасываются, пропуски остаются пропусками)."""
+    seconds = pd.Series(seconds)
+    valid = seconds.notna()
+    total = seconds.fillna(0).astype("int64")
+    hours = (total // 3600).astype("str")
+    minutes = (total % 3600 // 60).astype("str").str.zfill(2)
+    secs = (total % 60).astype("str").str.zfill(2)
+    return (hours + ":" + minutes + ":" + secs).where(valid)
@@ -0,0 +1,444 @@
+import copy
+import csv
+import datetime
+import hashlib
+import io
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+
+from stage_metrics import timed
+
+try:
+    import python_calamine
+except ImportError:  # Быстрый движок не установлен — читаем через openpyxl
+    python_calamine = None
+
+# Движки чтения .xlsx:
+#   calamine        — python-calamine (Rust): ячейки листа читает Rust, строки Python создаются по мере чтения
+#   openpyxl-stream — openpyxl read-only, потоково по строкам, можно остановиться на заголовке
+#   openpyxl        — полная загрузка книги openpyxl
+READER_BACKENDS = ['calamine', 'openpyxl-stream', 'openpyxl']
+
+# Файлы меньше этого размера без calamine читаются полной загрузкой openpyxl
+SMALL_FILE_MB = 1
+
+
+def _convert_cell(cell):
+    """Значение ячейки так же, как его отдает pd.read_excel (движок openpyxl)."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _convert_calamine(value):
+    """Значение ячейки python-calamine так же, как его отдает pd.read_excel."""
+    if isinstance(value, float):
+        as_int = int(value)
+        return as_int if as_int == value else value
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def _trim(row):
+    """Обрезает пустые ячейки в конце строки."""
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _compile_identifiers(identifiers):
+    """Один регулярный шаблон для списка идентификаторов заголовка (без учета регистра)."""
+    if isinstance(identifiers, str):
+        identifiers = [identifiers]
+    return re.compile("|".join(f"(?:{identifier})" for identifier in identifiers), re.IGNORECASE)
+
+
+def _rewind(file):
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+
+def _file_size(file):
+    if hasattr(file, "getbuffer"):
+        return file.getbuffer().nbytes
+    if hasattr(file, "read"):
+        position = file.tell()
+        size = file.seek(0, os.SEEK_END)
+        file.seek(position)
+        return size
+    return os.path.getsize(file)
+
+
+def available_backends():
+    """Движки чтения, доступные в текущем окружении."""
+    return [backend for backend in READER_BACKENDS if backend != "calamine" or python_calamine is not None]
+
+
+def choose_backend(file, need="sheet"):
+    """
+    Выбирает движок чтения по размеру файла и тому, что нужно вызывающему коду
+    (need: 'header' — только строки до заголовка, 'sheet' — весь лист, 'columns' — часть столбцов листа).
+
+    calamine, если установлен, быстрее во всех случаях (в 5–8 раз на целом листе, втрое на поиске
+    заголовка — openpyxl и в read-only режиме сначала разбирает все общие строки книги). Строки
+    отдаются лениво (iter_rows): при поиске заголовка значения Python создаются только для строк
+    до него, а весь лист списками не собирается.
+    Без него: заголовок ищем потоково с остановкой на нем; небольшие файлы целиком быстрее читает
+    полная загрузка openpyxl, большие — openpyxl-stream, который не держит всю книгу в памяти.
+    Замеры: benchmarks/bench_readers.py.
+    """
+    if python_calamine is not None:
+        return "calamine"
+    if need == "sheet" and _file_size(file) < SMALL_FILE_MB * 2**20:
+        return "openpyxl"
+    return "openpyxl-stream"
+
+
+def _rows_openpyxl(file, sheet_name, read_only):
+    _rewind(file)
+    wb = load_workbook(file, read_only=read_only, data_only=True, keep_links=False)
+    try:
+        sheet = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        if read_only:
+            sheet.reset_dimensions()
+            rows = sheet.rows
+        else:
+            # Как и в read-only режиме, начинаем с A1, не пропуская пустые строки и столбцы
+            rows = sheet.iter_rows(min_row=1, min_col=1)
+        for row in rows:
+            yield _trim([_convert_cell(cell) for cell in row])
+    finally:
+        wb.close()
+
+
+def _open_calamine(file):
+    _rewind(file)
+    if hasattr(file, "read"):
+        return python_calamine.CalamineWorkbook.from_filelike(file)
+    return python_calamine.CalamineWorkbook.from_path(os.fspath(file))
+
+
+def _open_calamine_sheet(file, sheet_name):
+    wb = _open_calamine(file)
+    return wb.get_sheet_by_index(sheet_name) if isinstance(sheet_name, int) else wb.get_sheet_by_name(sheet_name)
+
+
+def _rows_calamine(sheet):
+    """
+    Строки листа calamine по одной, начиная с A1: iter_rows отдает строки с первой, но пропускает
+    пустые столбцы слева — они восстанавливаются по sheet.start, как в to_python(skip_empty_area=False).
+    """
+    if sheet.start is None:  # пустой лист
+        return
+    padding = [""] * sheet.start[1]
+    for row in sheet.iter_rows():
+        yield _trim(padding + [_convert_calamine(value) for value in row])
+
+
+def iter_sheet_rows(file, sheet_name=0, backend=None, need="sheet"):
+    """
+    Строки листа списками значений (как их отдает pd.read_excel), без пустых ячеек в конце строки.
+    backend=None — движок выбирается choose_backend. Если calamine не установлен или не смог
+    разобрать файл, чтение прозрачно переходит на openpyxl-stream.
+    """
+    backend = backend or choose_backend(file, need)
+    if backend == "calamine" and python_calamine is not None:
+        try:
+            sheet = _open_calamine_sheet(file, sheet_name)
+        except Exception:
+            backend = "openpyxl-stream"
+        else:
+            return _rows_calamine(sheet)
+    return _rows_openpyxl(file, sheet_name, read_only=backend != "openpyxl")
+
+
+def sheet_names(file, backend=None):
+    """Список листов книги без разбора самих листов."""
+    if (backend or choose_backend(file, "header")) == "calamine" and python_calamine is not None:
+        return list(_open_calamine(file).sheet_names)
+    _rewind(file)
+    wb = load_workbook(file, read_only=True, keep_links=False)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+@timed("header", rows_out=lambda result: len(result[2]))
+def locate_header(file, identifiers, sheet_name=0, backend=None, header_only=False):
+    """
+    Читает лист и находит первую строку, в которой хотя бы одна ячейка содержит один из
+    identifiers (регулярные выражения, без учета регистра). Лист разбирается один раз:
+    строки до заголовка сохраняются (например, A1 с отчетным периодом), строки после — становятся данными.
+    При header_only=True чтение останавливается на заголовке и rows пуст.
+
+    Возвращает (preamble, header, rows) — списки значений ячеек.
+    Если заголовок не найден, возбуждает ValueError.
+    """
+    pattern = _compile_identifiers(identifiers)
+    need = "header" if header_only else "sheet"
+
+    preamble, header, rows = [], None, []
+    sheet_rows = iter_sheet_rows(file, sheet_name, backend, need)
+    try:
+        for values in sheet_rows:
+            if header is not None:
+                rows.append(values)
+            elif any(pattern.search(str(value)) for value in values if value != ""):
+                header = values
+                if header_only:
+                    break
+            else:
+                preamble.append(values)
+    finally:
+        if hasattr(sheet_rows, "close"):
+            sheet_rows.close()
+
+    if header is None:
+        raise ValueError(f"Идентификатор '{pattern.pattern}' не найден в файле.")
+
+    # Как и pd.read_excel: убираем пустые строки в конце листа
+    while rows and not rows[-1]:
+        rows.pop()
+    return preamble, header, rows
+
+
+def _pad(rows, width):
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+def read_with_header(file, identifiers, sheet_name=0, backend=None):
+    """
+    Загружает лист, используя как заголовок первую строку с identifiers.
+    Таблица совпадает с pd.read_excel(file, header=<номер этой строки>), но файл разбирается один раз.
+
+    Возвращает (df, preamble), где preamble — строки над заголовком.
+    """
+    preamble, header, rows = locate_header(file, identifiers, sheet_name, backend)
+    width = max(len(row) for row in preamble + [header] + rows)
+    df = TextParser(_pad([header] + rows, width), header=0).read()
+    return df, preamble
+
+
+def read_sheet(file, sheet_name=0, usecols=None, backend=None):
+    """
+    Весь лист с заголовком в первой строке — то же, что pd.read_excel(file, sheet_name, usecols=usecols),
+    но через выбранный (или автоматически подобранный) движок чтения.
+    """
+    rows = list(iter_sheet_rows(file, sheet_name, backend, "sheet" if usecols is None else "columns"))
+    while rows and not rows[-1]:
+        rows.pop()
+    if not rows:
+        return pd.DataFrame()
+    width = max(len(row) for row in rows)
+    return TextParser(_pad(rows, width), header=0, usecols=usecols).read()
+
+
+# Число строк в одной порции при потоковом чтении
+CHUNK_ROWS = 50_000
+
+
+def _chunks(header, rows, chunk_rows):
+    """Порции строк данных как DataFrame со столбцами header (пустые строки пропускаются)."""
+    width = len(header)
+    batch = []
+    for values in rows:
+        if not values:
+            continue
+        batch.append(values[:width] + [""] * (width - len(values)))
+        if len(batch) >= chunk_rows:
+            yield TextParser([header] + batch, header=0).read()
+            batch = []
+    if batch:
+        yield TextParser([header] + batch, header=0).read()
+
+
+def stream_with_header(file, identifiers, sheet_name=0, chunk_rows=CHUNK_ROWS):
+    """
+    Потоковое чтение листа .xlsx порциями по chunk_rows строк (openpyxl read-only):
+    в памяти одновременно находится только одна порция, сколько бы строк ни было в файле.
+
+    Возвращает (preamble, chunks): строки над заголовком и генератор DataFrame со столбцами
+    из строки заголовка (типы выводятся в каждой порции отдельно).
+    Если заголовок не найден, возбуждает ValueError.
+    """
+    pattern = _compile_identifiers(identifiers)
+    sheet_rows = _rows_openpyxl(file, sheet_name, read_only=True)
+    preamble = []
+    for values in sheet_rows:
+        if any(pattern.search(str(value)) for value in values if value != ""):
+            return preamble, _chunks(values, sheet_rows, chunk_rows)
+        preamble.append(values)
+    raise ValueError(f"Идентификатор '{pattern.pattern}' не найден в файле.")
+
+
+def stream_csv_with_header(file, identifiers, chunk_rows=CHUNK_ROWS, encoding="utf-8-sig"):
+    """
+    Потоковое чтение CSV порциями по chunk_rows строк. Заголовок — первая строка, содержащая
+    один из identifiers; разделитель (',', ';' или табуляция) определяется по ней.
+
+    Возвращает (preamble, chunks), как stream_with_header.
+    """
+    pattern = _compile_identifiers(identifiers)
+    _rewind(file)
+    if hasattr(file, "read"):
+        text = io.TextIOWrapper(file, encoding=encoding, newline="")
+    else:
+        text = open(file, encoding=encoding, newline="")
+    try:
+        lines = []
+        for line in text:
+            if pattern.search(line):
+                sep = max([",", ";", "\t"], key=line.count)
+                break
+            lines.append(line)
+        else:
+            raise ValueError(f"Идентификатор '{pattern.pattern}' не найден в файле.")
+    finally:
+        if hasattr(file, "read"):
+            text.detach()
+        else:
+            text.close()
+
+    preamble = [_trim(row) for row in csv.reader(lines, delimiter=sep)]
+    _rewind(file)
+    chunks = pd.read_csv(file, sep=sep, skiprows=len(lines), chunksize=chunk_rows, encoding=encoding)
+    return preamble, chunks
+
+
+def raw_table(header, rows):
+    """
+    Таблица из сырых строк листа: заголовок берется как есть (пустые ячейки -> NaN),
+    без переименования дублей и приведения типов.
+    """
+    width = max([len(header)] + [len(row) for row in rows])
+    header = [np.nan if value == "" else value for value in _pad([header], width)[0]]
+    data = [[np.nan if value == "" else value for value in row] for row in _pad(rows, width)]
+    return pd.DataFrame(data, columns=header)
+
+
+# Бюджет памяти кэша разобранных книг (общий для всех сессий Streamlit-процесса)
+WORKBOOK_CACHE_MAX_MB = 512
+
+
+def _size_of(value):
+    """
+    Приблизительный объем значения в памяти: таблицы считаются с учетом строк, объекты с nbytes
+    (накопители сумм UTM) — по своим таблицам, остальные значения — по sys.getsizeof.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(getattr(value, "nbytes", None), int):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_size_of(item) for item in value) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+class WorkbookCache:
+    """
+    Кэш разобранных листов Excel с вытеснением давно не используемых записей (LRU).
+
+    Ключ — SHA-256 содержимого файла, функция разбора и её аргументы, поэтому один и тот же
+    медиаплан, загруженный разными менеджерами, разбирается один раз. Потребители получают
+    копии, чтобы изменения таблиц в одном месте не портили кэш.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self.entries[key][0])
+            self.misses += 1
+
+        value = loader()
+        size = _size_of(value)
+        with self.lock:
+            if size <= self.max_bytes and key not in self.entries:
+                self.entries[key] = (value, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.size -= evicted_size
+        return copy.deepcopy(value)
+
+    def summary(self):
+        """Строка со статистикой для вывода в интерфейсе."""
+        return (f"Кэш книг: попаданий {self.hits}, промахов {self.misses}, "
+                f"записей {len(self.entries)}, {self.size / 2**20:.1f} из {self.max_bytes / 2**20:.0f} МБ")
+
+
+WORKBOOK_CACHE = WorkbookCache(WORKBOOK_CACHE_MAX_MB * 2**20)
+
+
+def file_digest(file):
+    """SHA-256 содержимого загруженного файла (UploadedFile, BytesIO или путь)."""
+    if hasattr(file, "getvalue"):
+        return hashlib.sha256(file.getvalue()).hexdigest()
+    if hasattr(file, "read"):
+        file.seek(0)
+        digest = hashlib.sha256(file.read()).hexdigest()
+        file.seek(0)
+        return digest
+    with open(file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _cached(file, name, loader, *args):
+    key = (file_digest(file), name) + args
+    return WORKBOOK_CACHE.get_or_load(key, lambda: loader(file, *args))
+
+
+def _identifiers_key(identifiers):
+    return (identifiers,) if isinstance(identifiers, str) else tuple(identifiers)
+
+
+def cached_read_with_header(file, identifiers, sheet_name=0):
+    """read_with_header через общий кэш книг."""
+    return _cached(file, "read_with_header",
+                   lambda f, ids, sheet: read_with_header(f, list(ids), sheet),
+                   _identifiers_key(identifiers), sheet_name)
+
+
+def cached_raw_table(file, identifiers, sheet_name=0):
+    """Сырая таблица от строки-заголовка (locate_header + raw_table) через общий кэш книг."""
+    def load(f, ids, sheet):
+        _, header, rows = locate_header(f, list(ids), sheet)
+        return raw_table(header, rows)
+    return _cached(file, "raw_table", load, _identifiers_key(identifiers), sheet_name)
+
+
+def cached_sheet_names(file):
+    """Список листов книги через общий кэш книг (без разбора самих листов)."""
+    return _cached(file, "sheet_names", sheet_names)
+
+
+def cached_read_excel(file, sheet_name=0):
+    """Целый лист (как pd.read_excel) через общий кэш книг."""
+    return _cached(file, "read_excel", read_sheet, sheet_name)
@@ -0,0 +1,117 @@
+"""
+Выгрузка таблиц отчета одной книгой Excel по запросу пользователя.
+
+Книга собирается в фоновом потоке потоковым писателем openpyxl (write_only: строки не копятся
+в памяти листа) и отдается байтами для кнопки скачивания. Файлы рядом с приложением не создаются,
+поэтому параллельные сессии не перезаписывают выгрузки друг друга.
+"""
+import datetime
+import hashlib
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# Сколько книг собирается одновременно (на все сессии)
+EXPORT_WORKERS = 2
+
+# Как часто страница проверяет, готова ли книга (секунды)
+EXPORT_REFRESH_SECONDS = 1
+
+# Ограничение Excel на длину имени листа и недопустимые в нем символы
+SHEET_TITLE_MAX = 31
+_SHEET_TITLE_FORBIDDEN = re.compile(r"[\[\]:*?/\\]")
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+
+def _sheet_title(name, used):
+    """Имя листа, допустимое в Excel и не совпадающее с уже использованными."""
+    base = _SHEET_TITLE_FORBIDDEN.sub(" ", str(name)).strip()[:SHEET_TITLE_MAX] or "Лист"
+    title, n = base, 1
+    while title.lower() in used:
+        n += 1
+        suffix = f" ({n})"
+        title = base[:SHEET_TITLE_MAX - len(suffix)] + suffix
+    used.add(title.lower())
+    return title
+
+
+def _cell(value):
+    """Значение ячейки в типе, который понимает openpyxl; остальные объекты пишутся строкой."""
+    if value is None or isinstance(value, (str, int, float, bool, datetime.date, datetime.time)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _column_values(series):
+    """Значения столбца списком Python-объектов для openpyxl (пропуски — пустые ячейки)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = pd.Series(series.dt.to_pydatetime(), index=series.index, dtype=object)
+    else:
+        values = series.astype(object)
+    values = values.where(series.notna(), None).tolist()
+    if series.dtype == object:
+        values = [_cell(value) for value in values]
+    return values
+
+
+def _frame_for_sheet(df):
+    """Таблица с плоскими заголовками; именованный индекс (например, РК) становится столбцом."""
+    if any(name is not None for name in df.index.names):
+        df = df.reset_index()
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.set_axis([" / ".join(str(part) for part in col if str(part)) for col in df.columns], axis=1)
+    return df
+
+
+def write_workbook(sheets):
+    """
+    Записывает книгу .xlsx и возвращает её байты.
+    sheets — {имя листа: DataFrame или текст}; текст пишется построчно в первый столбец.
+    """
+    wb = Workbook(write_only=True)
+    used = set()
+    for name, content in sheets.items():
+        ws = wb.create_sheet(_sheet_title(name, used))
+        if isinstance(content, str):
+            for line in content.splitlines():
+                ws.append([line])
+            continue
+        df = _frame_for_sheet(content)
+        ws.append([str(col) for col in df.columns])
+        for row in zip(*(_column_values(df.iloc[:, i]) for i in range(df.shape[1]))):
+            ws.append(row)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def sheets_digest(sheets):
+    """Хэш содержимого листов: по нему сессия понимает, что готовая книга устарела."""
+    digest = hashlib.sha256()
+    for name, content in sheets.items():
+        digest.update(repr(name).encode())
+        if isinstance(content, str):
+            digest.update(content.encode())
+        else:
+            digest.update(repr((list(content.columns), list(content.index.names))).encode())
+            digest.update(pd.util.hash_pandas_object(content, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def submit_export(sheets):
+    """
+    Запускает сборку книги в фоновом потоке и сразу возвращает Future с байтами .xlsx.
+    Таблицы копируются, чтобы дальнейшие изменения на странице не попали в собираемую книгу.
+    """
+    snapshot = {name: content if isinstance(content, str) else content.copy() for name, content in sheets.items()}
+    return _pool.submit(write_workbook, snapshot)
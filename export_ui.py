@@ -0,0 +1,37 @@
+"""
+Кнопка выгрузки в Excel для страниц Streamlit (geo.py, untitled0.py, stata.py).
+Сама книга собирается в export.py, который не зависит от Streamlit и используется пакетными скриптами.
+"""
+import streamlit as st
+
+from export import EXPORT_REFRESH_SECONDS, XLSX_MIME, sheets_digest, submit_export
+
+
+def show_export(sheets, file_name):
+    """
+    Кнопка выгрузки в Excel. Книга собирается в фоновом потоке только по нажатию и хранится в сессии
+    вместе с хэшем данных: если данные на странице изменились, устаревшая книга не предлагается.
+    """
+    digest = sheets_digest(sheets)
+    if st.button("Подготовить Excel-файл", key="export_start"):
+        st.session_state["export_job"] = (digest, submit_export(sheets))
+    job = st.session_state.get("export_job")
+    if job is None or job[0] != digest:
+        return
+    future = job[1]
+    pending = not future.done()
+
+    # Пока книга собирается, перезапускается только этот фрагмент
+    @st.fragment(run_every=EXPORT_REFRESH_SECONDS if pending else None)
+    def export_status():
+        if not future.done():
+            st.caption("Excel-файл готовится…")
+        elif pending:
+            st.rerun()  # Книга готова — перестраиваем страницу один раз, чтобы остановить проверку
+        elif future.exception() is not None:
+            st.error(f"Ошибка при подготовке Excel-файла: {future.exception()}")
+        else:
+            st.download_button("Скачать Excel-файл", future.result(), file_name=file_name, mime=XLSX_MIME,
+                               key="export_download")
+
+    export_status()
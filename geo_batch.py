@@ -0,0 +1,149 @@
+"""
+Пакетная генерация еженедельных отчетов ГЕО для всех клиентов без Streamlit.
+
+Список клиентов задается манифестом (CSV или JSON) со столбцами:
+    client, media_plan, utm, primary_calls, target_calls[, oh_primary_calls, oh_target_calls]
+Пути к файлам указываются относительно манифеста.
+
+Для каждого клиента в выходной папке создается подпапка с файлами:
+    report.txt, utm_summary.csv, weekly_budget.csv, plan_period.csv
+и общий summary.csv со статусом по всем клиентам.
+
+С --store выгрузки UTM дополнительно накапливаются в хранилище недельных агрегатов (weekly_store),
+а для каждого клиента пишутся utm_month_to_date.csv и utm_campaign_to_date.csv. Правила предупреждений
+(utm_rules) проверяются по всем клиентам, неделям и источникам хранилища сразу — результат в rule_warnings.csv.
+
+Пример:
+    python geo_batch.py clients.csv -o reports --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from geo_report import GEO_BUDGET_COL, format_utm_summary, generate_report, summarize_utm
+from utm_rules import UTM_RULES
+from weekly_store import WeeklyStore
+
+CALL_COLUMNS = ['primary_calls', 'target_calls', 'oh_primary_calls', 'oh_target_calls']
+
+
+def read_manifest(path):
+    """Читает манифест клиентов (CSV или JSON-список) и приводит пути к абсолютным."""
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            manifest = pd.DataFrame(json.load(f))
+    else:
+        manifest = pd.read_csv(path)
+
+    missing = [col for col in ['client', 'media_plan', 'utm'] if col not in manifest.columns]
+    if missing:
+        raise ValueError(f"В манифесте нет столбцов: {', '.join(missing)}")
+
+    base = os.path.dirname(os.path.abspath(path))
+    for col in ['media_plan', 'utm']:
+        manifest[col] = [os.path.join(base, str(p)) for p in manifest[col]]
+    for col in CALL_COLUMNS:
+        values = manifest[col] if col in manifest.columns else 0
+        manifest[col] = pd.to_numeric(values, errors='coerce')
+        manifest[col] = manifest[col].fillna(0).astype(int)
+    return manifest.to_dict('records')
+
+
+def _safe_name(name):
+    return "".join(ch if ch.isalnum() or ch in "-_ ." else "_" for ch in str(name)).strip() or "client"
+
+
+def run_client(job, output_dir, budget_col, exclude_sources, store_path=None):
+    """Строит отчет одного клиента и записывает файлы. Выполняется в отдельном процессе."""
+    started = time.perf_counter()
+    result = generate_report(job['media_plan'], job['utm'],
+                             job['primary_calls'], job['target_calls'],
+                             job['oh_primary_calls'], job['oh_target_calls'],
+                             budget_col=budget_col, exclude_sources=exclude_sources, client=job['client'])
+
+    client_dir = os.path.join(output_dir, _safe_name(job['client']))
+    os.makedirs(client_dir, exist_ok=True)
+    with open(os.path.join(client_dir, 'report.txt'), 'w', encoding='utf-8') as f:
+        f.write(result['report_text'])
+        if result['warnings']:
+            f.write("\nПРЕДУПРЕЖДЕНИЯ:\n" + "\n".join(result['warnings']) + "\n")
+    format_utm_summary(result['utm_summary']).to_csv(os.path.join(client_dir, 'utm_summary.csv'), index=False, encoding='utf-8-sig')
+    result['df_week_budget'].to_csv(os.path.join(client_dir, 'weekly_budget.csv'), index=False, encoding='utf-8-sig')
+    result['report_week_df'].to_csv(os.path.join(client_dir, 'plan_period.csv'), index=False, encoding='utf-8-sig')
+
+    store_status = ''
+    if store_path:
+        store = WeeklyStore(store_path)
+        store_status = store.ingest(job['client'], job['utm'], exclude_sources)['status']
+        for name, accumulated in [('utm_month_to_date.csv', store.month_to_date(job['client'], result['report_end'])),
+                                  ('utm_campaign_to_date.csv', store.campaign_to_date(job['client'], result['report_end']))]:
+            if accumulated is not None:
+                format_utm_summary(summarize_utm(accumulated)[0]).to_csv(os.path.join(client_dir, name), index=False, encoding='utf-8-sig')
+
+    return {
+        'client': job['client'],
+        'status': 'ok',
+        'period': f"{result['report_start']:%d.%m.%Y} - {result['report_end']:%d.%m.%Y}",
+        'warnings': len(result['warnings']),
+        'store': store_status,
+        'seconds': round(time.perf_counter() - started, 3),
+        'error': '',
+    }
+
+
+def run_batch(jobs, output_dir, workers=None, budget_col=GEO_BUDGET_COL, exclude_sources=(), store_path=None):
+    """
+    Запускает отчеты всех клиентов в пуле процессов.
+    Ошибка одного клиента не останавливает остальных — она попадает в сводку.
+    Возвращает сводную таблицу в порядке манифеста.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run_client, job, output_dir, budget_col, tuple(exclude_sources), store_path): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                rows[i] = future.result()
+            except Exception as e:
+                rows[i] = {'client': jobs[i]['client'], 'status': 'error', 'period': '',
+                           'warnings': 0, 'store': '', 'seconds': None, 'error': f"{type(e).__name__}: {e}"}
+                print(f"[{jobs[i]['client']}] ошибка: {e}", file=sys.stderr)
+
+    summary = pd.DataFrame([rows[i] for i in range(len(jobs))])
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'), index=False, encoding='utf-8-sig')
+
+    if store_path:
+        weekly = WeeklyStore(store_path).weekly_summary([job['client'] for job in jobs])
+        UTM_RULES.evaluate(weekly).to_csv(os.path.join(output_dir, 'rule_warnings.csv'), index=False, encoding='utf-8-sig')
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная генерация еженедельных отчетов ГЕО")
+    parser.add_argument('manifest', help="CSV или JSON со списком клиентов")
+    parser.add_argument('-o', '--output', default='reports', help="папка для отчетов (по умолчанию reports)")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    parser.add_argument('--budget-col', default=GEO_BUDGET_COL, help="столбец бюджета в медиаплане")
+    parser.add_argument('--exclude-source', action='append', default=[],
+                        help="UTM Source, исключаемый из отчета (можно указать несколько раз)")
+    parser.add_argument('--store', default=None, help="файл SQLite хранилища недельных агрегатов UTM")
+    args = parser.parse_args(argv)
+
+    jobs = read_manifest(args.manifest)
+    started = time.perf_counter()
+    summary = run_batch(jobs, args.output, args.workers, args.budget_col, args.exclude_source, args.store)
+    failed = int((summary['status'] != 'ok').sum())
+    print(f"Готово: {len(summary) - failed} из {len(summary)} отчетов за {time.perf_counter() - started:.1f} с "
+          f"-> {os.path.abspath(args.output)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import streamlit as st
+import pandas as pd
+
+from client_files import pair_files
+from excel_io import WORKBOOK_CACHE
+from geo_pipeline import uploaded_digest
+from geo_report import GEO_BUDGET_COL, format_utm_summary, generate_report_summary_from_bytes
+
+# Сколько отчетов строится одновременно
+DASHBOARD_WORKERS = min(8, os.cpu_count() or 1)
+
+# Как часто обновляется таблица статусов, пока есть отчеты в работе (секунды)
+DASHBOARD_REFRESH_SECONDS = 2
+
+
+@st.cache_resource
+def get_report_pool():
+    """Пул процессов для отчетов, общий для всех сессий."""
+    return ProcessPoolExecutor(max_workers=DASHBOARD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def submit_reports(clients, files_by_name):
+    """
+    Отправляет в пул отчеты клиентов, для которых выбраны оба файла.
+    Задачи хранятся в сессии по ключу (хэши файлов, звонки, клиент), поэтому повторный запуск страницы
+    не пересчитывает уже готовые или выполняющиеся отчеты. Результат задачи — только сводка отчета
+    (geo_report.summarize_report); задачи, которых больше нет в таблице клиентов, удаляются из сессии.
+    """
+    jobs = st.session_state.setdefault("dashboard_jobs", {})
+    active = {}
+    for row in clients.to_dict("records"):
+        mp_file, utm_file = files_by_name.get(row["Медиаплан"]), files_by_name.get(row["Метки"])
+        if mp_file is None or utm_file is None:
+            continue
+        primary_calls, target_calls = int(row["Первичные звонки"]), int(row["ЦО"])
+        client = row["Клиент"] if isinstance(row["Клиент"], str) and row["Клиент"] else None
+        key = (uploaded_digest(mp_file), uploaded_digest(utm_file), primary_calls, target_calls, client)
+        if key not in jobs:
+            jobs[key] = get_report_pool().submit(
+                generate_report_summary_from_bytes, mp_file.name, mp_file.getvalue(), utm_file.name,
+                utm_file.getvalue(), primary_calls, target_calls, budget_col=GEO_BUDGET_COL, client=client)
+        active[client or mp_file.name] = key
+
+    # Отчеты, которых больше нет в таблице (другие файлы или звонки), не храним в сессии
+    for key in set(jobs) - set(active.values()):
+        jobs.pop(key).cancel()
+    return {client: jobs[key] for client, key in active.items()}
+
+
+def status_table(active):
+    """Сводная таблица по клиентам; незавершенные отчеты помечаются «в работе»."""
+    rows = []
+    for client, future in active.items():
+        row = {"Клиент": client}
+        if not future.done():
+            row["Статус"] = "в работе"
+        elif future.exception() is not None:
+            row["Статус"] = f"ошибка: {future.exception()}"
+        else:
+            row["Статус"] = "готов"
+            row.update(future.result()["status"])
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+st.title("Дашборд еженедельных отчётов ГЕО")
+
+uploaded_files = st.file_uploader("Загрузите медиапланы и выгрузки меток всех клиентов",
+                                  type=["xlsx", "csv"], accept_multiple_files=True)
+
+if uploaded_files:
+    files_by_name = {f.name: f for f in uploaded_files}
+    file_names = sorted(files_by_name)
+
+    st.subheader("Клиенты")
+    st.caption("Пары файлов подобраны по именам; проверьте их и введите звонки.")
+    clients = st.data_editor(
+        pair_files([f.name for f in uploaded_files]),
+        column_config={
+            "Медиаплан": st.column_config.SelectboxColumn(options=file_names),
+            "Метки": st.column_config.SelectboxColumn(options=file_names),
+            "Первичные звонки": st.column_config.NumberColumn(min_value=0, step=1),
+            "ЦО": st.column_config.NumberColumn(min_value=0, step=1),
+        },
+        hide_index=True, num_rows="dynamic", key="dashboard_clients")
+    clients = clients.fillna({"Первичные звонки": 0, "ЦО": 0})
+
+    active = submit_reports(clients, files_by_name)
+
+    # Таблица статусов обновляется сама, пока отчеты строятся, не блокируя остальную страницу
+    pending = any(not future.done() for future in active.values())
+
+    @st.fragment(run_every=DASHBOARD_REFRESH_SECONDS if pending else None)
+    def show_status():
+        st.subheader("Статус клиентов")
+        if not active:
+            st.info("Нет клиентов с выбранными медиапланом и метками.")
+            return
+        st.dataframe(status_table(active), hide_index=True)
+        if pending and all(future.done() for future in active.values()):
+            st.rerun()  # Все отчеты готовы — перестраиваем страницу, чтобы они появились в списке
+
+    show_status()
+
+    # Отчет клиента строится на странице только при выборе
+    ready = [client for client, future in active.items() if future.done() and future.exception() is None]
+    selected = st.selectbox("Открыть отчет клиента", ["—"] + ready, key="dashboard_selected")
+    if selected != "—":
+        result = active[selected].result()
+        for warning in result["warnings"]:
+            st.warning(warning)
+        st.text_area("Еженедельный отчет", result["report_text"], height=600)
+        utm_group_by = st.selectbox("Группировка UTM", list(result["utm_summaries"]), key="dashboard_utm_group_by")
+        st.dataframe(format_utm_summary(result["utm_summaries"][utm_group_by]))
+        st.write("План МП за период:", result["report_week_df"])
+else:
+    # Файлы убраны — готовые отчеты больше не нужны
+    st.session_state.pop("dashboard_jobs", None)
+
+# Статистика общего кэша разобранных книг
+st.sidebar.caption(WORKBOOK_CACHE.summary())
@@ -0,0 +1,120 @@
+"""
+Этапы построения еженедельного отчета для страниц Streamlit (geo.py, untitled0.py).
+
+Каждый этап кэшируется отдельно, и его ключ состоит только из его собственных входов:
+  parse     — ошибки разбора медиаплана и отчетный период меток (хэш файла, столбец бюджета)
+  allocate  — итоги раскладки бюджета и KPI по неделям (хэш медиаплана, столбец бюджета)
+  aggregate — сводка UTM по выбранному ключу (хэш меток, источники, ключ группировки)
+  window    — план за отчетный или произвольный период (хэши файлов, период, разрез)
+  render    — текст отчета (не кэшируется: быстрый и единственный зависит от числа звонков)
+
+Поэтому изменение звонков перезапускает только render, а смена группировки UTM — только aggregate.
+Файлы передаются параметрами с подчеркиванием: Streamlit их не хэширует, ключом служит хэш содержимого.
+
+В st.cache_data хранятся только небольшие результаты этапов. Сами разобранные таблицы берутся
+из общих кэшей с ограниченным объемом (дисковый кэш таблиц и кэш книг) и в st.cache_data не попадают,
+а куб плана по дням и полная недельная раскладка (строка на площадку и неделю) хранятся в st.cache_resource
+без копирования при чтении — страницы их только показывают и не изменяют.
+"""
+import streamlit as st
+
+from excel_io import file_digest
+from geo_report import (build_report, load_prepared_media_plan, open_utm, plan_for_period, read_utm_period, summarize_utm,
+                        utm_group_keys, weekly_plan)
+from pacing import PlanCube
+
+# Сколько вариантов каждого этапа хранится в кэше (файлы, периоды, группировки) и сколько секунд
+STAGE_CACHE_ENTRIES = 32
+STAGE_CACHE_TTL = 3600
+
+# Сколько кубов плана по дням (массивы дни × площадки) и недельных раскладок хранится одновременно
+PLAN_CUBE_ENTRIES = 8
+
+
+def uploaded_digest(file):
+    """Хэш содержимого загруженного файла; считается один раз на загрузку (по file_id) и хранится в сессии."""
+    file_id = getattr(file, "file_id", None)
+    if file_id is None:
+        return file_digest(file)
+    digests = st.session_state.setdefault("uploaded_digests", {})
+    if file_id not in digests:
+        digests[file_id] = file_digest(file)
+    return digests[file_id]
+
+
+def parse_media_plan(budget_col, mp_file):
+    """Нормализованный медиаплан и ошибки разбора периодов: (df, errors) — из дискового кэша таблиц."""
+    return load_prepared_media_plan(mp_file, budget_col)
+
+
+def parse_utm(exclude_sources, utm_file):
+    """Отфильтрованные метки (таблица или WeightedAccumulator) — из дискового кэша таблиц или кэша книг."""
+    utm, _ = open_utm(utm_file, exclude_sources)
+    return utm
+
+
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def media_plan_errors(mp_digest, budget_col, _mp_file):
+    """Только ошибки разбора медиаплана."""
+    return parse_media_plan(budget_col, _mp_file)[1]
+
+
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def utm_period(utm_digest, _utm_file):
+    """Только отчетный период меток: (start, end); таблица не разбирается — читаются строки до заголовка."""
+    return read_utm_period(_utm_file)
+
+
+@st.cache_resource(max_entries=PLAN_CUBE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def week_plan(mp_digest, budget_col, _mp_file):
+    """Раскладка по неделям (df_week_budget, df_weekly_category_budget, df_weekly_category_kpi) — общие таблицы, только для чтения."""
+    df, _ = parse_media_plan(budget_col, _mp_file)
+    return weekly_plan(df, budget_col)
+
+
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def allocate_weeks(mp_digest, budget_col, _mp_file):
+    """Итоги раскладки: (бюджет категорий по неделям, KPI категорий по неделям, недели плана)."""
+    df_week_budget, df_weekly_category_budget, df_weekly_category_kpi = week_plan(mp_digest, budget_col, _mp_file)
+    return df_weekly_category_budget, df_weekly_category_kpi, df_week_budget[['Неделя с', 'Неделя по']].drop_duplicates()
+
+
+def week_budget(mp_digest, budget_col, mp_file):
+    """Недельный бюджет по всем площадкам — общая таблица из st.cache_resource, не изменять."""
+    return week_plan(mp_digest, budget_col, mp_file)[0]
+
+
+@st.cache_resource(max_entries=PLAN_CUBE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def plan_cube(mp_digest, budget_col, _mp_file):
+    """Куб плана по дням для запросов за любой период (общий объект, только для чтения)."""
+    df, _ = parse_media_plan(budget_col, _mp_file)
+    return PlanCube.from_plan(df, budget_col)
+
+
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def aggregate_utm(utm_digest, exclude_sources, by, _utm_file):
+    """Сводка UTM по ключу by, итоги и ключи, доступные для группировки: (summary, totals, keys)."""
+    utm = parse_utm(exclude_sources, _utm_file)
+    utm_summary, utm_totals = summarize_utm(utm, by=by)
+    return utm_summary, utm_totals, utm_group_keys(utm)
+
+
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def report_window(mp_digest, budget_col, report_start, report_end, _mp_file):
+    """План по категориям за отчетный период."""
+    return plan_for_period(plan_cube(mp_digest, budget_col, _mp_file), report_start, report_end)
+
+
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, ttl=STAGE_CACHE_TTL, show_spinner=False)
+def custom_window(mp_digest, budget_col, start, end, by, _mp_file):
+    """План за произвольный период в разрезе категорий ('category') или площадок ('site')."""
+    return plan_cube(mp_digest, budget_col, _mp_file).window(start, end, by=by)
+
+
+def render_report(report_start, report_end, report_week_df, utm_totals,
+                  tp_primary_calls, tp_target_calls, oh_primary_calls=0, oh_target_calls=0):
+    """Текст отчета: единственный этап, который зависит от введенного числа звонков."""
+    report_text, _ = build_report(report_start, report_end, report_week_df, utm_totals,
+                                  tp_primary_calls, tp_target_calls, oh_primary_calls, oh_target_calls)
+    return report_text
+
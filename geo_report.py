@@ -0,0 +1,515 @@
+"""
+Конвейер еженедельного отчета ГЕО без привязки к интерфейсу:
+разбор медиаплана, раскладка плана по неделям, сводка UTM и текст отчета.
+Используется geo.py / untitled0.py (Streamlit) и пакетным запуском geo_batch.py.
+"""
+import io
+import re
+
+import pandas as pd
+
+from compact_dtypes import COMPACT_DTYPES, UTM_PROFILE
+from durations import format_durations, parse_durations
+from excel_io import (WORKBOOK_CACHE, _file_size, cached_read_with_header, file_digest, locate_header,
+                      stream_csv_with_header, stream_with_header)
+from numeric_parse import coercion_warnings, parse_numeric_columns
+from pacing import PlanCube, allocate_weekly
+from stage_metrics import stage, timed
+from table_cache import TABLE_CACHE
+from utm import GROUP_KEYS, WeightedAccumulator, weighted_summary
+from utm_rules import UTM_RULES
+
+# Столбец бюджета в медиаплане ГЕО
+GEO_BUDGET_COL = 'Общая стоимость с учетом НДС и АК'
+
+# Выгрузки UTM больше этого размера (и любые CSV) читаются потоково, порциями
+UTM_STREAM_MB = 20
+
+
+def load_media_plan(file):
+    """Загружает медиаплан: заголовок — первая строка с '№'; полностью пустой первый столбец удаляется."""
+    df_mp, _ = cached_read_with_header(file, '№')
+    if df_mp.iloc[:, 0].isna().all():
+        df_mp = df_mp.iloc[:, 1:]
+    return df_mp
+
+
+def load_utm(file):
+    """Загружает выгрузку UTM: заголовок — первая строка с 'UTM Source'. Возвращает (таблица, строки над заголовком)."""
+    return cached_read_with_header(file, 'UTM Source')
+
+
+@timed("dates")
+def extract_report_period(preamble):
+    """
+    Извлекает отчетный период из первой строки файла с метками.
+    Ожидается, что в ячейке A1 содержится строка вида:
+    "Отчет за период с YYYY-MM-DD по YYYY-MM-DD" или "Отчет за период с DD.MM.YYYY по DD.MM.YYYY"
+    Если период не найден, возвращает (NaT, NaT).
+    """
+    header_str = str(preamble[0][0]) if preamble and preamble[0] else ""
+    # Регулярное выражение для поиска дат
+    match = re.search(r'Отчет за период с\s*([\d\.\-]+)\s*по\s*([\d\.\-]+)', header_str)
+    if not match:
+        return pd.NaT, pd.NaT
+    # Определяем формат даты: если в строке есть тире, то используем формат ISO, иначе – формат с точками.
+    date_format = "%Y-%m-%d" if "-" in match.group(1) else "%d.%m.%Y"
+    return pd.to_datetime(match.group(1), format=date_format), pd.to_datetime(match.group(2), format=date_format)
+
+
+def read_utm_period(file):
+    """Отчетный период выгрузки UTM без разбора таблицы: читаются только строки до заголовка."""
+    if str(getattr(file, 'name', file)).lower().endswith('.csv'):
+        preamble, chunks = stream_csv_with_header(file, 'UTM Source')
+        chunks.close()
+    else:
+        preamble, _, _ = locate_header(file, 'UTM Source', header_only=True)
+    return extract_report_period(preamble)
+
+
+def determine_category(row):
+    if pd.isna(row['№']):
+        # Если значение отсутствует, используем значение из "Название сайта"
+        return row['Название сайта']
+    elif isinstance(row['№'], str):
+        # Если значение есть и это строка, используем его как категорию
+        return row['№']
+    else:
+        # Если значение присутствует, но не является строкой (например, число), оставляем пустым
+        return pd.NA
+
+
+def extract_dates(period):
+    """Начальная и конечная дата из периода вида 'DD.MM.YYYY - DD.MM.YYYY'. Ошибку формата пробрасывает."""
+    start_date, end_date = period.split('-')
+    return pd.to_datetime(start_date.strip(), format='%d.%m.%Y'), pd.to_datetime(end_date.strip(), format='%d.%m.%Y')
+
+
+def prepare_media_plan(df_mp, budget_col=GEO_BUDGET_COL):
+    """
+    Готовит строки медиаплана к раскладке:
+      - категория площадки из строк-заголовков разделов
+      - 'Start Date' / 'End Date' из столбца 'Период'
+      - числовые бюджет и 'KPI прогноз' ('-', пустые и нераспознанные -> 0)
+    Возвращает (df, errors) — errors содержит сообщения о нераспознанных периодах и числах.
+    """
+    df, numeric_report = parse_numeric_columns(
+        df_mp[['№', 'Название сайта', 'Период', budget_col, 'KPI прогноз']], [budget_col, 'KPI прогноз'])
+    df['Категория'] = df.apply(determine_category, axis=1).ffill()
+    df = df[~df['Период'].isna()]
+
+    errors = coercion_warnings(numeric_report, "Медиаплан")
+
+    def parse_period(period):
+        try:
+            return extract_dates(period)
+        except Exception as e:
+            errors.append(f"Ошибка в данных периода: {period}. Ошибка: {str(e)}")
+            return pd.NaT, pd.NaT
+
+    with stage("dates") as running:
+        df[['Start Date', 'End Date']] = df['Период'].apply(parse_period).apply(pd.Series)
+        running.rows_in = running.rows_out = len(df)
+    return df, errors
+
+
+def load_prepared_media_plan(file, budget_col=GEO_BUDGET_COL):
+    """
+    load_media_plan + prepare_media_plan через дисковый кэш таблиц:
+    повторная загрузка того же файла не читает Excel. Возвращает (df, errors).
+    """
+    def build():
+        df, errors = prepare_media_plan(load_media_plan(file), budget_col)
+        return df, {'errors': errors}
+    df, extra = TABLE_CACHE.get_or_build((file_digest(file), 'media_plan', budget_col), build)
+    return df, extra['errors']
+
+
+def weekly_plan(df, budget_col=GEO_BUDGET_COL):
+    """
+    Раскладывает бюджет и KPI по неделям.
+    Возвращает (df_week_budget, df_weekly_category_budget, df_weekly_category_kpi).
+    """
+    df_weekly = allocate_weekly(df, budget_col).reset_index(drop=True)
+    df_week_budget = df_weekly[['Неделя с', 'Неделя по', 'Бюджет на неделю', 'Название сайта', 'Категория']].copy()
+    df_week_kpi = df_weekly[['Неделя с', 'Неделя по', 'KPI на неделю', 'Категория', 'Название сайта']].copy()
+
+    df_weekly_category_budget = df_week_budget.groupby(['Категория', 'Неделя с', 'Неделя по'], as_index=False)['Бюджет на неделю'].sum()
+    df_weekly_category_kpi = df_week_kpi.groupby(['Категория', 'Неделя с', 'Неделя по'], as_index=False)['KPI на неделю'].sum()
+    return df_week_budget, df_weekly_category_budget, df_weekly_category_kpi
+
+
+def filter_utm(df_metki, exclude_sources=()):
+    """Оставляет кампании 'arwm' (без указанных источников) и переводит время на сайте в секунды."""
+    df_filtered = df_metki[df_metki['UTM Campaign'].astype(str).str.contains('arwm', na=False, case=False)]
+    if exclude_sources:
+        df_filtered = df_filtered[~df_filtered['UTM Source'].astype(str).isin(list(exclude_sources))]
+    df_filtered = df_filtered.copy()
+    df_filtered['Время на сайте'] = parse_durations(df_filtered['Время на сайте'])
+    return df_filtered
+
+
+def load_filtered_utm(file, exclude_sources=(), compact=None):
+    """
+    load_utm + filter_utm через дисковый кэш таблиц.
+    compact — хранить таблицу в компактных типах (UTM_PROFILE), по умолчанию COMPACT_DTYPES.
+    Возвращает (отфильтрованная таблица, строки над заголовком).
+    """
+    compact = COMPACT_DTYPES if compact is None else compact
+
+    def build():
+        df_metki, preamble = load_utm(file)
+        df_filtered = filter_utm(df_metki, exclude_sources)
+        if not compact:
+            return df_filtered, {'preamble': preamble}
+        df_filtered, report = UTM_PROFILE.compact(df_filtered)
+        return df_filtered, {'preamble': preamble, 'memory': report}
+    key = (file_digest(file), 'utm', tuple(sorted(exclude_sources))) + (('compact',) if compact else ())
+    df_filtered, extra = TABLE_CACHE.get_or_build(key, build)
+    UTM_PROFILE.record(str(getattr(file, 'name', file)), extra.get('memory'))
+    return df_filtered, extra['preamble']
+
+
+def stream_utm(file, exclude_sources=(), chunk_rows=None):
+    """
+    Потоковая обработка большой выгрузки UTM (.xlsx или CSV): файл читается порциями,
+    каждая порция фильтруется filter_utm и сворачивается в суммы для взвешенных средних.
+    Память не зависит от числа строк. Возвращает (WeightedAccumulator, строки над заголовком).
+    """
+    kwargs = {'chunk_rows': chunk_rows} if chunk_rows else {}
+    if str(getattr(file, 'name', file)).lower().endswith('.csv'):
+        preamble, chunks = stream_csv_with_header(file, 'UTM Source', **kwargs)
+    else:
+        preamble, chunks = stream_with_header(file, 'UTM Source', **kwargs)
+    accumulator = WeightedAccumulator()
+    for chunk in chunks:
+        accumulator.add(filter_utm(chunk, exclude_sources))
+    return accumulator, preamble
+
+
+def open_utm(file, exclude_sources=()):
+    """
+    Метки для сводки: .xlsx до UTM_STREAM_MB читается целиком (через дисковый кэш таблиц),
+    большие файлы и CSV — потоково, а накопленные суммы хранятся в общем кэше книг.
+    Возвращает (таблица или WeightedAccumulator, строки над заголовком).
+    """
+    is_csv = str(getattr(file, 'name', file)).lower().endswith('.csv')
+    if is_csv or _file_size(file) > UTM_STREAM_MB * 2**20:
+        key = (file_digest(file), 'stream_utm', tuple(sorted(exclude_sources)))
+        return WORKBOOK_CACHE.get_or_load(key, lambda: stream_utm(file, exclude_sources))
+    return load_filtered_utm(file, exclude_sources)
+
+
+def utm_group_keys(utm):
+    """Ключи, по которым можно сгруппировать метки (таблицу или WeightedAccumulator)."""
+    if isinstance(utm, WeightedAccumulator):
+        return list(utm.keys)
+    return [key for key in GROUP_KEYS if key in utm.columns]
+
+
+def format_seconds(total_seconds):
+    total_seconds = int(total_seconds)
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def summarize_utm(utm, by="UTM Source"):
+    """
+    Сводка UTM по ключу by (время на сайте в секундах) и итоги по всем строкам.
+    utm — отфильтрованная таблица или WeightedAccumulator после потокового чтения.
+    Для вывода время переводится в Ч:ММ:СС функцией format_utm_summary.
+    """
+    if isinstance(utm, WeightedAccumulator):
+        return utm.summary(by)
+    return weighted_summary(utm, by=by)
+
+
+def format_utm_summary(utm_summary):
+    """Сводка UTM для вывода и выгрузки: время на сайте в виде Ч:ММ:СС."""
+    return utm_summary.assign(**{"Время на сайте": format_durations(utm_summary["Время на сайте"])})
+
+
+def utm_warnings(utm_summary, client=None):
+    """
+    Предупреждения по источникам по правилам UTM_RULES (по умолчанию: высокие отказы и роботность,
+    время на сайте меньше минуты); пороги берутся для клиента client, если они для него заданы.
+    """
+    return UTM_RULES.messages(utm_summary, client=client)
+
+
+def plan_for_period(plan_cube, report_start, report_end):
+    """План по категориям за отчетный период: точные суммы по дням из куба плана (KPI округлен)."""
+    report_week_df = plan_cube.window(report_start, report_end)
+    report_week_df['KPI'] = report_week_df['KPI'].round()
+    return report_week_df
+
+
+def get_work_done(report_start, report_end):
+    work_done = set()
+
+    # Проверка первой группы работ (до 10 числа)
+    if report_start.day < 10:
+        work_done.update([
+            "Запустили РК",
+            "Подготовили скрин-отчет с актуальными размещениями"
+        ])
+
+    # Проверка второй группы работ (с 14 по 16 число)
+    if any(day in range(14, 17) for day in range(report_start.day, report_end.day + 1)):
+        work_done.update([
+            "Заменили рекламные материалы на актуальные",
+            "Подготовили скрин-отчет с актуальными размещениями",
+            "Подготовили МП-Факт предыдущего месяца",
+            "Провели оптимизацию РК для улучшения поведенческих факторов",
+            "Провели усиление РК для привлечения ЦО"
+        ])
+
+    # Проверка третьей группы работ (с 17 по 25 число)
+    if any(day in range(17, 26) for day in range(report_start.day, report_end.day + 1)):
+        work_done.update([
+            "Провели оптимизацию РК для улучшения поведенческих факторов",
+            "Провели усиление РК для привлечения ЦО",
+            "Актуализировали Карту развития",
+            "Подготовили медиапланирование на следующий месяц"
+        ])
+
+    # Проверка для четвертой группы работ (с 26 числа)
+    if report_start.day >= 26 or report_end.day >= 26:
+        work_done.update([
+            "Провели оптимизацию РК для улучшения поведенческих факторов",
+            "Провели усиление РК для привлечения ЦО",
+            "Подготовили материалы на следующий месяц",
+            "Подготовились к запуску РК"
+        ])
+
+    return sorted(work_done)  # Сортируем для удобства чтения
+
+
+def get_work_done_future(report_start, report_end):
+    work_done_future = set()
+
+    # Проверка первой группы работ (до 10 числа)
+    if report_start.day < 10:
+        work_done_future.update([
+            "Следить за динамикой открута и выполнением по ЦО",
+            "Оптимизация РК для улучшение поведенческих факторов",
+            "Усиление РК для привлечения ЦО",
+            "Замена рекламных материалов на актуальные",
+            "Подготовка скрин-отчет с актуальными размещениями"
+        ])
+
+    # Проверка второй группы работ (с 14 по 16 число)
+    if any(day in range(14, 17) for day in range(report_start.day, report_end.day + 1)):
+        work_done_future.update([
+            "Следить за динамикой открута и выполнением по ЦО",
+            "Отпимизация РК для улучшение поведенческих факторов",
+            "Усиление РК для привлечения ЦО",
+            "Актуализация карты развития",
+            "Подготовка МП на следующий месяц"
+        ])
+
+    # Проверка третьей группы работ (с 17 по 25 число)
+    if any(day in range(17, 26) for day in range(report_start.day, report_end.day + 1)):
+        work_done_future.update([
+            "Следить за динамикой открута и выполнением по ЦО",
+            "Оптимизация РК для улучшение поведенческих факторов",
+            "Усиление РК для привлечения ЦО",
+            "Подготовка материалов на следующий месяц"
+        ])
+
+    # Проверка для четвертой группы работ (с 26 числа)
+    if report_start.day >= 26 or report_end.day >= 26:
+        work_done_future.update([
+            "Следить за динамикой открута и выполнением по ЦО",
+            "Оптимизация РК для улучшение поведенческих факторов",
+            "Усиление РК для привлечения ЦО",
+            "Запуск РК",
+            "Подготовка скрин-отчет с актуальными размещениями",
+            "Подготовка МП-Факт",
+            "Подготовка итогового отчета"
+        ])
+
+    return sorted(work_done_future)  # Сортируем для удобства чтения
+
+
+def plan_status(target_calls, kpi):
+    """Выполнение плана ЦО в процентах (если плана нет — 100 %)."""
+    if pd.notna(kpi) and kpi != 0:
+        return f"{((target_calls - kpi) / kpi) * 100 + 100:.0f} %" if pd.notna(target_calls) else "0 %"
+    return "100 %"
+
+
+def _money(value):
+    return f"{value:,.2f}".replace(',', ' ') if value > 0 else "0"
+
+
+def build_report(report_start, report_end, report_week_df, utm_totals,
+                 tp_primary_calls, tp_target_calls, oh_primary_calls=0, oh_target_calls=0):
+    """
+    Формирует текст еженедельного отчета.
+    Бюджет и KPI берутся из плана за период (report_week_df), метрики — из итогов UTM.
+    Возвращает (report_text, details) — details содержит бюджеты, KPI и статусы для сводных таблиц.
+    """
+    # Вычисляем общие суммы
+    total_plan_kpi = report_week_df["KPI"].sum()
+    total_fact_calls = tp_target_calls + oh_target_calls
+
+    # Определяем комментарий
+    comments = []
+    if total_plan_kpi > 0:
+        if total_fact_calls == total_plan_kpi:
+            comments.append("Реализация объемов ЦО идет согласно плановым")
+        elif total_fact_calls < total_plan_kpi:
+            comments.append("Реализация объемов ЦО меньше плановых. Выполняем усиления РК")
+        else:
+            comments.append("Реализация объемов ЦО превышает плановые")
+
+    categories = report_week_df['Категория'].astype(str).str.strip()
+    # Бюджет для категорий, содержащих слово "тема" (Тематические площадки) и "охват" (Охватное размещение)
+    tp_budget = report_week_df.loc[categories.str.contains('тема', case=False, na=False), 'Бюджет'].sum()
+    oh_budget = report_week_df.loc[categories.str.contains('охват|программатик|бф', case=False, na=False), 'Бюджет'].sum()
+
+    # KPI для "Тематических площадок" и "Охватного размещения"
+    kpi_tp = report_week_df.loc[categories.str.contains('тема', case=False, na=False), 'KPI'].sum()
+    kpi_oh = report_week_df.loc[categories.str.contains('охват', case=False, na=False), 'KPI'].sum()
+
+    tp_status = plan_status(tp_target_calls, kpi_tp)
+    oh_status = plan_status(oh_target_calls, kpi_oh)
+
+    # Рассчитываем CPL для первичных обращений
+    tp_cpl = tp_budget / tp_primary_calls if tp_primary_calls > 0 else 0
+    oh_cpl = oh_budget / oh_primary_calls if oh_primary_calls > 0 else 0
+
+    work_done_str = "\n".join([f" - {task}" for task in get_work_done(report_start, report_end)])
+    work_done_future_str = "\n".join([f" - {task}" for task in get_work_done_future(report_start, report_end)])
+
+    report_text = f"""
+Медийная реклама ({report_start.strftime('%d.%m.%y')}-{report_end.strftime('%d.%m.%y')})
+
+ТЕМАТИЧЕСКИЕ ПЛОЩАДКИ:
+Выполнение по бюджету плановое ({_money(tp_budget)} ₽ с НДС)
+Первичные обращения — {tp_primary_calls}
+CPL (первичных обращений) — {_money(tp_cpl)} ₽ с НДС
+ЦО — {tp_target_calls}
+Выполнение плана ЦО: {tp_status}
+
+ОХВАТНЫЕ РАЗМЕЩЕНИЯ:
+Выполнение по бюджету плановое ({_money(oh_budget)} ₽ с НДС)
+Первичные обращения — {oh_primary_calls}
+CPL (первичных обращений) — {_money(oh_cpl)} ₽ с НДС
+Целевые обращения — {oh_target_calls}
+Выполнение плана ЦО: {oh_status}
+
+МЕТРИКИ:
+- Выполнение плана по бюджету 100%
+- Отказы: {utm_totals['Отказы'] * 100:.2f}%
+- Глубина просмотра: {utm_totals['Глубина просмотра']:.2f}
+- Время на сайте: {format_seconds(utm_totals['Время на сайте'])}
+- Роботность: {utm_totals['Роботность'] * 100:.2f}%
+
+КОММЕНТАРИИ:
+{chr(10).join(comments)}
+
+ПРОДЕЛАННЫЕ РАБОТЫ:
+{work_done_str}
+
+ПЛАНОВЫЕ РАБОТЫ:
+{work_done_future_str}
+    """
+
+    details = {
+        'tp_budget': tp_budget, 'oh_budget': oh_budget,
+        'kpi_tp': kpi_tp, 'kpi_oh': kpi_oh,
+        'tp_status': tp_status, 'oh_status': oh_status,
+        'total_plan_kpi': total_plan_kpi, 'total_fact_calls': total_fact_calls,
+    }
+    return report_text, details
+
+
+def generate_report(mp_file, utm_file, tp_primary_calls, tp_target_calls, oh_primary_calls=0, oh_target_calls=0,
+                    budget_col=GEO_BUDGET_COL, exclude_sources=(), client=None):
+    """
+    Полный конвейер отчета для одной пары (медиаплан, выгрузка UTM).
+    client — имя клиента для его порогов в правилах предупреждений.
+    Возвращает словарь с текстом отчета и промежуточными таблицами; ошибки пробрасывает.
+    """
+    df, period_errors = load_prepared_media_plan(mp_file, budget_col)
+    df_week_budget, df_weekly_category_budget, _ = weekly_plan(df, budget_col)
+    plan_cube = PlanCube.from_plan(df, budget_col)
+
+    utm, metki_preamble = open_utm(utm_file, exclude_sources)
+    report_start, report_end = extract_report_period(metki_preamble)
+    if pd.isna(report_start) or pd.isna(report_end):
+        raise ValueError("Не удалось извлечь отчетный период из первой строки файла с метками.")
+
+    utm_summary, utm_totals = summarize_utm(utm)
+    report_week_df = plan_for_period(plan_cube, report_start, report_end)
+    report_text, details = build_report(report_start, report_end, report_week_df, utm_totals,
+                                        tp_primary_calls, tp_target_calls, oh_primary_calls, oh_target_calls)
+    return {
+        'report_text': report_text,
+        'report_start': report_start,
+        'report_end': report_end,
+        'warnings': period_errors + utm_warnings(utm_summary, client),
+        'utm': utm,
+        'utm_summary': utm_summary,
+        'utm_totals': utm_totals,
+        'report_week_df': report_week_df,
+        'df_week_budget': df_week_budget,
+        'df_weekly_category_budget': df_weekly_category_budget,
+        'plan_cube': plan_cube,
+        'details': details,
+    }
+
+
+def generate_report_from_bytes(mp_name, mp_data, utm_name, utm_data, *args, **kwargs):
+    """generate_report по содержимому загруженных файлов — для запуска в отдельном процессе."""
+    mp_file = io.BytesIO(mp_data)
+    mp_file.name = mp_name
+    utm_file = io.BytesIO(utm_data)
+    utm_file.name = utm_name
+    return generate_report(mp_file, utm_file, *args, **kwargs)
+
+
+def summarize_report(result):
+    """
+    Небольшая часть результата generate_report для хранения между перезапусками страницы:
+    текст отчета, предупреждения, строка сводной таблицы, план за период и сводки UTM
+    по всем ключам группировки — без таблицы меток и куба плана.
+    """
+    utm = result['utm']
+    return {
+        'report_text': result['report_text'],
+        'warnings': result['warnings'],
+        'status': report_status(result),
+        'report_week_df': result['report_week_df'],
+        'utm_summaries': {by: result['utm_summary'] if by == 'UTM Source' else summarize_utm(utm, by=by)[0]
+                          for by in utm_group_keys(utm)},
+    }
+
+
+def generate_report_summary_from_bytes(*args, **kwargs):
+    """summarize_report(generate_report_from_bytes(...)) — в процесс-родитель передается только сводка."""
+    return summarize_report(generate_report_from_bytes(*args, **kwargs))
+
+
+def report_status(result):
+    """
+    Строка сводной таблицы по клиенту: бюджет плана за период, темп бюджета (доля всего плана,
+    приходящаяся на дни по конец отчетного периода), выполнение плана ЦО и число предупреждений.
+    """
+    details = result['details']
+    budget_share, _ = result['plan_cube'].progress(result['report_end'])
+    plan_kpi = details['total_plan_kpi']
+    fact_calls = details['total_fact_calls']
+    return {
+        'Период': f"{result['report_start']:%d.%m.%Y} - {result['report_end']:%d.%m.%Y}",
+        'Бюджет за период': round(float(result['report_week_df']['Бюджет'].sum()), 2),
+        'Темп бюджета, %': round(float(budget_share) * 100, 1),
+        'План ЦО': float(plan_kpi),
+        'Факт ЦО': fact_calls,
+        'Выполнение ЦО, %': round(float(fact_calls / plan_kpi) * 100, 1) if plan_kpi > 0 else None,
+        'Предупреждения': len(result['warnings']),
+    }
@@ -0,0 +1,119 @@
+"""
+Разбор числовых столбцов выгрузок и медиапланов, записанных текстом по-русски.
+
+Понимает пробелы (в том числе неразрывные и узкие) как разделители тысяч, десятичную запятую,
+суффиксы '₽' / 'руб.' / '%', знак минуса (включая типографский '−') и заглушки вида '-'.
+Если в числе есть и точка, и запятая, десятичным считается последний из разделителей,
+а повторяющийся разделитель ('1.234.567', '1,234,567') — разделителем тысяч. Проценты остаются
+в процентах: '12,5%' → 12.5.
+
+Столбцы, которые уже числовые, не разбираются. Текстовые значения всех столбцов разбираются
+за один проход по общей серии, а отчет показывает по каждому столбцу, сколько ячеек разобрано
+из текста, сколько было заглушками и сколько не распознано (они заменяются на fill).
+"""
+import numpy as np
+import pandas as pd
+
+# Значения, которые означают «нет данных» и заменяются на fill без предупреждения
+PLACEHOLDERS = ("", "-", "—", "–", "nan", "none", "null", "н/д")
+
+# Сколько нераспознанных значений столбца показывается в отчете как примеры
+EXAMPLES_MAX = 3
+
+REPORT_COLUMNS = ["столбец", "ячеек", "числа", "из текста", "заглушки", "не распознано", "примеры"]
+
+# Пробелы перечислены явно: в строковых столбцах pandas (pyarrow) \s не включает неразрывные пробелы
+_SPACE_PATTERN = "[\\s\u00a0\u2007\u2009\u202f]+"
+_SUFFIX_PATTERN = r"(?:₽|руб\.?|р\.|rub|%)+$"
+
+# Число: тысячи через точку с десятичной запятой, тысячи через запятую с десятичной точкой
+# или цифры с одним разделителем
+_NUMBER_PATTERN = (r"[+-]?(?:\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d{1,3}(?:,\d{3})+(?:\.\d+)?"
+                   r"|\d+(?:[.,]\d*)?|[.,]\d+)")
+
+
+def parse_numbers(text):
+    """
+    Числа из серии строк: (values, placeholder) — float64 с NaN для нераспознанного
+    и маска заглушек. Все операции векторные (методы .str строкового столбца pandas).
+    """
+    text = (text.astype("str").str.lower()
+            .str.replace(_SPACE_PATTERN, "", regex=True)
+            .str.replace(_SUFFIX_PATTERN, "", regex=True)
+            .str.replace("−", "-", regex=False))
+    placeholder = text.isin(PLACEHOLDERS)
+
+    # Десятичный разделитель — единственный в записи и последний из разделителей
+    comma_decimal = (text.str.count(",") == 1) & text.str.contains(r",[^.]*$", regex=True)
+    dot_decimal = (text.str.count(r"\.") == 1) & text.str.contains(r"\.[^,]*$", regex=True)
+
+    without_commas = text.str.replace(",", "", regex=False)
+    cleaned = (without_commas.str.replace(".", "", regex=False)
+               .where(~dot_decimal, without_commas)
+               .where(~comma_decimal, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)))
+    # Строки, не подходящие под запись числа ('1..2', '1,2,3'), не разбираются
+    valid = text.str.fullmatch(_NUMBER_PATTERN).fillna(False).astype(bool)
+    values = cleaned.where(valid).astype("float64")
+    return values, placeholder
+
+
+def parse_numeric_columns(df, columns, fill=0):
+    """
+    Приводит столбцы columns к числам. Возвращает (df, report):
+      df     — таблица с числовыми столбцами (исходная не меняется);
+      report — DataFrame по столбцам: ячеек, числа (уже были числами), из текста, заглушки,
+               не распознано и примеры нераспознанных значений.
+    Пустые ячейки, заглушки и нераспознанные значения заменяются на fill.
+    """
+    df = df.copy(deep=False)
+    columns = [col for col in dict.fromkeys(columns) if col in df.columns]
+    rows = {col: {"столбец": col, "ячеек": len(df), "числа": len(df), "из текста": 0,
+                  "заглушки": 0, "не распознано": 0, "примеры": ""} for col in columns}
+
+    # Быстрый путь: числовые столбцы и значения, которые pandas разбирает сам, не трогаются
+    text_parts = {}
+    for col in columns:
+        series = df[col]
+        rows[col]["заглушки"] = int(series.isna().sum())
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            rows[col]["числа"] = len(series) - rows[col]["заглушки"]
+            df[col] = series.fillna(fill)
+            continue
+        if pd.api.types.infer_dtype(series, skipna=True) == "string":
+            # Только строки: pandas их все равно не разберет, сразу разбираем как текст
+            numbers = pd.Series(np.nan, index=series.index)
+        else:
+            numbers = pd.to_numeric(series, errors="coerce")
+        positions = np.flatnonzero((numbers.isna() & series.notna()).to_numpy())
+        rows[col]["числа"] = int(numbers.notna().sum())
+        df[col] = numbers.astype("float64")
+        if len(positions):
+            text_parts[col] = pd.Series(series.to_numpy()[positions], index=positions)
+
+    if text_parts:
+        # Текст всех столбцов разбирается одной серией: первый уровень индекса — столбец, второй — позиция строки
+        values, placeholder = parse_numbers(pd.concat(text_parts))
+        unparsed = values.isna() & ~placeholder
+        for col, text in text_parts.items():
+            col_values = values.loc[col].to_numpy()
+            col_unparsed = unparsed.loc[col].to_numpy()
+            rows[col]["из текста"] = int((~np.isnan(col_values)).sum())
+            rows[col]["заглушки"] += int(placeholder.loc[col].sum())
+            rows[col]["не распознано"] = int(col_unparsed.sum())
+            examples = text[col_unparsed].astype(str).unique()[:EXAMPLES_MAX]
+            rows[col]["примеры"] = ", ".join(f"'{value}'" for value in examples)
+            parsed = df[col].to_numpy(copy=True)
+            parsed[text.index] = col_values
+            df[col] = parsed
+
+    for col in columns:
+        df[col] = df[col].fillna(fill)
+    return df, pd.DataFrame(list(rows.values()), columns=REPORT_COLUMNS)
+
+
+def coercion_warnings(report, source=""):
+    """Предупреждения о нераспознанных значениях по отчету parse_numeric_columns."""
+    prefix = f"{source}: " if source else ""
+    return [f"{prefix}в столбце «{row['столбец']}» не распознано чисел: {row['не распознано']} "
+            f"(например, {row['примеры']})"
+            for row in report.to_dict("records") if row["не распознано"]]
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+
+# 1970-01-01 — четверг, поэтому (дни с эпохи + 3) % 7 дает номер дня недели с понедельника = 0
+_EPOCH_WEEKDAY = 3
+
+
+def _to_days(values):
+    """Переводит даты в число дней с 1970-01-01 и возвращает маску пропусков (NaT)."""
+    days = pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[D]')
+    mask = np.isnat(days)
+    return np.where(mask, 0, days.astype('int64')), mask
+
+
+def allocate_weekly(df, budget_col, kpi_col='KPI прогноз', start_col='Start Date', end_col='End Date',
+                    carry_cols=('Название сайта', 'Категория')):
+    """
+    Раскладывает бюджет и KPI каждой строки медиаплана по календарным неделям (пн–вс)
+    за один векторизованный проход.
+
+    Для каждой строки берутся все недели от понедельника недели старта до воскресенья
+    недели окончания. Доля недели = активные дни кампании в неделе / все дни кампании.
+      - бюджет недели = бюджет * доля
+      - KPI недели = round(KPI * доля)
+
+    Результат совпадает с построчными calculate_budget_per_week / calculate_kpi_per_week.
+    Возвращает длинную таблицу (строка МП, неделя): индекс — метка строки исходного df,
+    столбцы 'Неделя с', 'Неделя по', 'Бюджет на неделю', 'KPI на неделю' и carry_cols.
+    """
+    start, start_nat = _to_days(df[start_col])
+    end, end_nat = _to_days(df[end_col])
+    valid = ~(start_nat | end_nat)
+
+    budget = pd.to_numeric(df[budget_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    if kpi_col in df.columns:
+        kpi = pd.to_numeric(df[kpi_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    else:
+        kpi = np.zeros(len(df))
+
+    # Понедельник недели старта и воскресенье недели окончания
+    first_monday = start - (start + _EPOCH_WEEKDAY) % 7
+    last_sunday = end + 6 - (end + _EPOCH_WEEKDAY) % 7
+    n_weeks = np.where(valid, (last_sunday - first_monday) // 7 + 1, 0)
+    n_weeks = np.clip(n_weeks, 0, None)
+
+    # Разворачиваем строки в недели: позиция строки и порядковый номер недели внутри строки
+    row_pos = np.repeat(np.arange(len(df)), n_weeks)
+    offsets = np.cumsum(n_weeks) - n_weeks
+    week_no = np.arange(row_pos.size) - np.repeat(offsets, n_weeks)
+
+    week_start = first_monday[row_pos] + 7 * week_no
+    week_end = week_start + 6
+
+    # Активные дни кампании внутри недели
+    active_start = np.maximum(week_start, start[row_pos])
+    active_end = np.minimum(week_end, end[row_pos])
+    active_days = active_end - active_start + 1
+    total_days = end[row_pos] - start[row_pos] + 1
+
+    active = active_days > 0
+    share = np.divide(active_days, total_days, out=np.zeros(row_pos.size), where=active)
+    week_budget = np.where(active, budget[row_pos] * share, 0.0)
+    week_kpi = np.where(active, np.round(kpi[row_pos] * share), 0).astype('int64')
+
+    result = pd.DataFrame({
+        'Неделя с': week_start.astype('datetime64[D]').astype('datetime64[ns]'),
+        'Неделя по': week_end.astype('datetime64[D]').astype('datetime64[ns]'),
+        'Бюджет на неделю': week_budget,
+        'KPI на неделю': week_kpi,
+    }, index=df.index[row_pos])
+    for col in carry_cols:
+        if col in df.columns:
+            result[col] = df[col].to_numpy()[row_pos]
+    return result
+
+
+# Предел ячеек плотных матриц куба (строки медиаплана × дни периода): при ошибке в дате
+# (например, 2205 год вместо 2025) период растягивается на века, и накопленные суммы
+# тогда считаются по запросу, а не хранятся матрицами
+PLAN_CUBE_MAX_CELLS = 5_000_000
+
+
+class PlanCube:
+    """
+    Куб плана «площадка × день» с накопленными суммами бюджета и KPI по оси дней.
+
+    Строится один раз на медиаплан: бюджет и KPI каждой строки равномерно распределяются
+    по дням её периода. Сумма плана за любой период (неделя, месяц, произвольный интервал)
+    считается как разность двух накопленных сумм — без повторного прохода по таблице
+    и с учетом неполных недель.
+
+    Если строки × дни больше PLAN_CUBE_MAX_CELLS, матрицы не строятся: накопленные суммы
+    на нужный день считаются из дневных норм строк (результат тот же, память — по строкам).
+    """
+
+    def __init__(self, first_day, n_days, sites, categories, offsets, total_days, budget_rate, kpi_rate, codes,
+                 dense=True):
+        self.first_day = first_day
+        self.n_days = n_days
+        self.sites = sites
+        self.categories = categories
+        self.offsets = offsets
+        self.total_days = total_days
+        self.budget_rate = budget_rate
+        self.kpi_rate = kpi_rate
+        self.codes = codes
+        self.site_budget = self.site_kpi = self.category_budget = self.category_kpi = None
+        if dense:
+            # Накопленные суммы на начало каждого дня 0..n_days
+            self.site_budget, self.site_kpi = self._site_sums(np.arange(n_days + 1)[None, :])
+            self.category_budget = self._by_category(self.site_budget)
+            self.category_kpi = self._by_category(self.site_kpi)
+
+    @classmethod
+    def from_plan(cls, df, budget_col, kpi_col='KPI прогноз', start_col='Start Date', end_col='End Date',
+                  site_col='Название сайта', category_col='Категория'):
+        """Строит куб по строкам медиаплана с заполненными 'Start Date' / 'End Date'."""
+        start, start_nat = _to_days(df[start_col])
+        end, end_nat = _to_days(df[end_col])
+        total_days = end - start + 1
+        valid = ~(start_nat | end_nat) & (total_days > 0)
+
+        budget = pd.to_numeric(df[budget_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        if kpi_col in df.columns:
+            kpi = pd.to_numeric(df[kpi_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        else:
+            kpi = np.zeros(len(df))
+
+        first_day = start[valid].min() if valid.any() else 0
+        n_days = int(end[valid].max() - first_day + 1) if valid.any() else 0
+
+        # Дневная норма строки; у строк без периода число дней 0, и они ничего не добавляют
+        safe_total = np.where(valid, total_days, 1)
+        total_days = np.where(valid, total_days, 0)
+
+        if category_col in df.columns:
+            codes, categories = pd.factorize(df[category_col])
+        else:
+            codes, categories = np.full(len(df), -1), []
+
+        sites = df[site_col].to_numpy() if site_col in df.columns else df.index.to_numpy()
+        return cls(first_day, n_days, sites, np.asarray(categories), start - first_day, total_days,
+                   budget / safe_total, kpi / safe_total, codes,
+                   dense=len(df) * (n_days + 1) <= PLAN_CUBE_MAX_CELLS)
+
+    def _site_sums(self, days):
+        """Накопленные суммы бюджета и KPI строк к началу дней days: дневная норма * прошедшие дни кампании."""
+        elapsed = np.minimum(np.clip(days - self.offsets[:, None], 0, None), self.total_days[:, None])
+        return elapsed * self.budget_rate[:, None], elapsed * self.kpi_rate[:, None]
+
+    def _by_category(self, sums):
+        """Накопленные суммы строк, свернутые по категориям."""
+        result = np.zeros((len(self.categories), sums.shape[1]))
+        has_category = self.codes >= 0
+        np.add.at(result, self.codes[has_category], sums[has_category])
+        return result
+
+    def _column(self, day, by):
+        """Накопленные бюджет и KPI к началу дня day (индекс от first_day) по категориям или площадкам."""
+        if self.site_budget is not None:
+            if by == 'category':
+                return self.category_budget[:, day], self.category_kpi[:, day]
+            return self.site_budget[:, day], self.site_kpi[:, day]
+        budget, kpi = self._site_sums(np.array([[day]]))
+        if by == 'category':
+            budget, kpi = self._by_category(budget), self._by_category(kpi)
+        return budget[:, 0], kpi[:, 0]
+
+    def _bounds(self, start, end):
+        """Индексы накопленных сумм для периода start..end включительно."""
+        start_day = pd.Timestamp(start).to_datetime64().astype('datetime64[D]').astype('int64')
+        end_day = pd.Timestamp(end).to_datetime64().astype('datetime64[D]').astype('int64')
+        i = int(np.clip(start_day - self.first_day, 0, self.n_days))
+        j = int(np.clip(end_day - self.first_day + 1, 0, self.n_days))
+        return i, max(i, j)
+
+    def window(self, start, end, by='category'):
+        """
+        Возвращает план за период start..end (включительно) по категориям (by='category')
+        или по площадкам (by='site'): столбцы 'Бюджет' и 'KPI'.
+        Строки без плана в этом периоде не выводятся.
+        """
+        label = 'Категория' if by == 'category' else 'Название сайта'
+        if pd.isna(start) or pd.isna(end):
+            return pd.DataFrame({label: pd.Series(dtype=object), 'Бюджет': pd.Series(dtype='float64'),
+                                 'KPI': pd.Series(dtype='float64')})
+
+        labels = self.categories if by == 'category' else self.sites
+        i, j = self._bounds(start, end)
+        budget_i, kpi_i = self._column(i, by)
+        budget_j, kpi_j = self._column(j, by)
+        result = pd.DataFrame({
+            label: labels,
+            'Бюджет': budget_j - budget_i,
+            'KPI': kpi_j - kpi_i,
+        })
+        return result[(result['Бюджет'] != 0) | (result['KPI'] != 0)].reset_index(drop=True)
+
+    def progress(self, end):
+        """Доли бюджета и KPI всего плана, приходящиеся на дни по end включительно (от 0 до 1)."""
+        _, j = self._bounds(pd.Timestamp(self.first_day, unit='D'), end)
+        total_budget, total_kpi = (sums.sum() for sums in self._column(self.n_days, 'site'))
+        budget_j, kpi_j = (sums.sum() for sums in self._column(j, 'site'))
+        budget_share = budget_j / total_budget if total_budget > 0 else 0.0
+        kpi_share = kpi_j / total_kpi if total_kpi > 0 else 0.0
+        return budget_share, kpi_share
@@ -0,0 +1,184 @@
+"""
+Индекс названий площадок медиаплана для сопоставления с ними загруженных РК.
+
+Строится один раз на медиаплан: нормализованные названия, их варианты (без доменной зоны,
+без разделителей) и обратный индекс «слово → площадки». Название РК ищется по индексу,
+а не перебором строк медиаплана; результат — площадка с оценкой совпадения (от 0 до 1),
+а при неоднозначном или неточном совпадении — список кандидатов с оценками.
+"""
+import bisect
+import difflib
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+# Столбцы медиаплана с названием площадки (в порядке приоритета)
+PLATFORM_COLUMNS = ["площадка", "название сайта", "ресурс"]
+
+# Оценка, начиная с которой совпадение принимается без подтверждения, и минимальная оценка кандидата
+CONFIDENT_SCORE = 0.75
+MIN_SCORE = 0.3
+
+# Если у второй площадки оценка ниже лучшей меньше чем на это значение, совпадение неоднозначно
+AMBIGUITY_MARGIN = 0.1
+
+# Сколько кандидатов возвращается для неоднозначных и неточных совпадений
+MAX_CANDIDATES = 5
+
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+_URL_PREFIX_PATTERN = re.compile(r"^(https?://)?(www\.)?")
+_DOMAIN_ZONE_PATTERN = re.compile(r"\.(ru|рф|su|com|net|org|io|me|tv|info)$")
+
+
+def normalize_name(name):
+    """Название в нижнем регистре, ё → е, без «http://», «www.» и лишних пробелов."""
+    name = str(name).strip().lower().replace("ё", "е")
+    name = _URL_PREFIX_PATTERN.sub("", name).rstrip("/")
+    return re.sub(r"\s+", " ", name)
+
+
+def name_tokens(name):
+    """Слова нормализованного названия (буквы и цифры) без доменной зоны: «ru» есть почти у всех площадок."""
+    return _TOKEN_PATTERN.findall(_DOMAIN_ZONE_PATTERN.sub("", name))
+
+
+def name_aliases(name):
+    """Варианты нормализованного названия: как есть, без доменной зоны и слитно без разделителей."""
+    return {alias for alias in (name, _DOMAIN_ZONE_PATTERN.sub("", name), "".join(name_tokens(name))) if alias}
+
+
+class PlatformIndex:
+    """
+    Индекс площадок одного медиаплана. Строки с одинаковым нормализованным названием
+    объединяются в одну площадку; resolve возвращает все её строки.
+    """
+
+    def __init__(self, mp_df):
+        self.mp_df = mp_df
+        self.column = next((col for col in PLATFORM_COLUMNS if col in mp_df.columns), None)
+        self.names = []      # нормализованные названия площадок
+        self.platforms = []  # названия площадок как в медиаплане
+        self.row_labels = []  # строки медиаплана каждой площадки
+        self.aliases = defaultdict(set)
+        self.tokens = defaultdict(set)
+        self._platform_ids = {}
+        if self.column is None:
+            self.vocabulary = []
+            return
+
+        name_ids = {}
+        for label, raw in zip(mp_df.index, mp_df[self.column]):
+            if pd.isna(raw):
+                continue
+            name = normalize_name(raw)
+            if name in ("", "0", "nan"):
+                continue
+            if name not in name_ids:
+                name_ids[name] = len(self.names)
+                self.names.append(name)
+                self.platforms.append(str(raw).strip())
+                self.row_labels.append([])
+            self.row_labels[name_ids[name]].append(label)
+
+        for name_id, name in enumerate(self.names):
+            for alias in name_aliases(name):
+                self.aliases[alias].add(name_id)
+            for token in name_tokens(name):
+                self.tokens[token].add(name_id)
+        self.vocabulary = sorted(self.tokens)
+        self._platform_ids = {platform: name_id for name_id, platform in enumerate(self.platforms)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefixed(self, token):
+        """Слова словаря, начинающиеся с token (поиск по отсортированному словарю)."""
+        start = bisect.bisect_left(self.vocabulary, token)
+        end = bisect.bisect_left(self.vocabulary, token + "￿")
+        return self.vocabulary[start:end]
+
+    def _scores(self, query):
+        """
+        Оценки площадок для нормализованного названия РК:
+          1.0       — название или его вариант совпадает с вариантом названия площадки;
+          0.8–1.0   — название РК входит в название площадки (чем длиннее вхождение, тем выше);
+          до 0.7    — доля слов РК, с которых начинаются слова площадки;
+          до 0.5    — похожие слова (опечатки), если ничего не нашлось.
+        """
+        scores = {}
+        for alias in name_aliases(query):
+            for name_id in self.aliases.get(alias, ()):
+                scores[name_id] = 1.0
+
+        tokens = name_tokens(query)
+        matched_tokens = defaultdict(int)
+        for token in tokens:
+            for name_id in set().union(*(self.tokens[word] for word in self._prefixed(token))):
+                matched_tokens[name_id] += 1
+        for name_id, matched in matched_tokens.items():
+            if name_id in scores:
+                continue
+            name = self.names[name_id]
+            if query in name:
+                scores[name_id] = 0.8 + 0.2 * len(query) / len(name)
+            else:
+                scores[name_id] = 0.7 * matched / len(tokens)
+
+        if not scores and query:
+            # Вхождение внутрь слова («vito» в «avito.ru») индексом по началу слов не находится
+            for name_id, name in enumerate(self.names):
+                if query in name:
+                    scores[name_id] = 0.8 + 0.2 * len(query) / len(name)
+
+        if not scores:
+            for token in tokens:
+                for word in difflib.get_close_matches(token, self.vocabulary, n=MAX_CANDIDATES, cutoff=0.75):
+                    ratio = difflib.SequenceMatcher(None, token, word).ratio()
+                    for name_id in self.tokens[word]:
+                        scores[name_id] = max(scores.get(name_id, 0), 0.5 * ratio / len(tokens))
+        return scores
+
+    def resolve(self, campaign_name):
+        """
+        Сопоставляет название РК с площадками. Возвращает словарь:
+          status     — 'match' (уверенное совпадение), 'ambiguous' (несколько близких площадок),
+                       'near' (только неточные совпадения) или 'none';
+          platform   — площадка при status == 'match', иначе None;
+          score      — её оценка;
+          candidates — список (площадка, оценка) по убыванию оценки.
+        """
+        scores = self._scores(normalize_name(campaign_name))
+        ranked = sorted(((score, name_id) for name_id, score in scores.items() if score >= MIN_SCORE),
+                        key=lambda item: (-item[0], item[1]))[:MAX_CANDIDATES]
+        candidates = [(self.platforms[name_id], round(score, 3)) for score, name_id in ranked]
+
+        if not ranked:
+            status = 'none'
+        elif ranked[0][0] < CONFIDENT_SCORE:
+            status = 'near'
+        elif len(ranked) > 1 and ranked[0][0] - ranked[1][0] < AMBIGUITY_MARGIN:
+            status = 'ambiguous'
+        else:
+            status = 'match'
+        return {
+            'status': status,
+            'platform': candidates[0][0] if status == 'match' else None,
+            'score': candidates[0][1] if candidates else 0.0,
+            'candidates': candidates,
+        }
+
+    def resolve_all(self, campaign_names):
+        """Сопоставляет все названия РК за один проход (одинаковые названия ищутся один раз)."""
+        resolved = {}
+        by_query = {}
+        for campaign_name in campaign_names:
+            query = normalize_name(campaign_name)
+            if query not in by_query:
+                by_query[query] = self.resolve(campaign_name)
+            resolved[campaign_name] = by_query[query]
+        return resolved
+
+    def rows(self, platform):
+        """Строки медиаплана площадки (по названию из candidates / platform)."""
+        return self.mp_df.loc[self.row_labels[self._platform_ids[platform]]]
@@ -0,0 +1,137 @@
+import hashlib
+import io
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Сколько секунд скачанная таблица считается свежей без повторного запроса
+SHEET_CACHE_TTL = 300
+
+# Сколько таблиц скачивается одновременно
+SHEET_FETCH_WORKERS = 8
+
+# Предельные число таблиц и объем кэша (тело ответа и разобранная таблица), общие для всех сессий
+SHEET_CACHE_MAX_ENTRIES = 200
+SHEET_CACHE_MAX_MB = 256
+
+
+def google_sheet_csv_url(url):
+    """Ссылка на выгрузку листа Google-таблицы в CSV по обычной ссылке на таблицу."""
+    sheet_id = url.split("/d/")[1].split("/")[0]
+    gid = url.split("gid=")[1].split("&")[0] if "gid=" in url else "0"
+    return f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+
+
+class SheetFetcher:
+    """
+    Параллельная загрузка CSV по ссылкам с кэшем.
+
+    Каждая ссылка хранится вместе с телом ответа, ETag / Last-Modified и временем загрузки:
+      - пока не истек ttl, сеть не трогаем
+      - после ttl отправляем условный запрос; на 304 продлеваем запись
+      - CSV разбирается заново только если содержимое действительно изменилось
+
+    Записей не больше max_entries и суммарно не больше max_bytes: сверх них вытесняются давно
+    не запрашивавшиеся ссылки (LRU). Таблица больше max_bytes возвращается, но не кэшируется.
+    """
+
+    def __init__(self, ttl=SHEET_CACHE_TTL, max_workers=SHEET_FETCH_WORKERS, timeout=30,
+                 max_entries=SHEET_CACHE_MAX_ENTRIES, max_bytes=SHEET_CACHE_MAX_MB * 2**20):
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _store(self, url, entry):
+        """Сохраняет запись ссылки и вытесняет самые старые, пока кэш больше пределов."""
+        entry["size"] = len(entry["body"]) + int(entry["df"].memory_usage(deep=True).sum())
+        with self.lock:
+            previous = self.entries.pop(url, None)
+            if previous is not None:
+                self.size -= previous["size"]
+            if entry["size"] > self.max_bytes:
+                return
+            self.entries[url] = entry
+            self.size += entry["size"]
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted["size"]
+
+    def _download(self, url):
+        """Скачивает одну ссылку (или подтверждает, что она не изменилась) и обновляет запись кэша."""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+        now = time.monotonic()
+        if entry is not None and now - entry["fetched_at"] < self.ttl:
+            return entry
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                body = response.read()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                entry = dict(entry, fetched_at=now)
+                self._store(url, entry)
+                return entry
+            raise
+
+        digest = hashlib.sha256(body).hexdigest()
+        if entry is not None and entry["digest"] == digest:
+            entry = dict(entry, etag=etag, last_modified=last_modified, fetched_at=now)
+        else:
+            entry = {"digest": digest, "body": body, "df": None}
+            entry.update(etag=etag, last_modified=last_modified, fetched_at=now)
+
+        # Разбираем CSV только для новых или изменившихся таблиц
+        if entry["df"] is None:
+            entry["df"] = pd.read_csv(io.BytesIO(body))
+
+        self._store(url, entry)
+        return entry
+
+    def fetch_all(self, urls):
+        """
+        Загружает все ссылки параллельно.
+        Возвращает словарь {ссылка: DataFrame или исключение, если загрузка не удалась}.
+        """
+        urls = list(dict.fromkeys(urls))
+        results = {}
+        if not urls:
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            futures = {url: pool.submit(self._download, url) for url in urls}
+            for url, future in futures.items():
+                try:
+                    results[url] = future.result()["df"].copy()
+                except Exception as e:
+                    results[url] = e
+        return results
+
+    def summary(self):
+        """Строка со статистикой для вывода в интерфейсе."""
+        return (f"Кэш Google-таблиц: записей {len(self.entries)} из {self.max_entries}, "
+                f"{self.size / 2**20:.1f} из {self.max_bytes / 2**20:.0f} МБ")
+
+
+SHEET_FETCHER = SheetFetcher()
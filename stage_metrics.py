@@ -0,0 +1,249 @@
+"""
+Замеры этапов перезапуска страницы: время, строки на входе и выходе и пик памяти.
+
+StageTimer создается в начале страницы; этапы выполняются через timer.run(name, func, ...)
+или внутри with timer.stage(name). Функции библиотеки (поиск заголовка, разбор дат, process_data)
+помечены декоратором timed и попадают в замеры текущей страницы вложенными этапами
+('parse › header'); вне страницы (пакетная обработка, процессы графиков) декоратор ничего не делает.
+
+Строки считаются по таблицам: len() DataFrame / Series, .rows у WeightedAccumulator,
+у кортежа — по первой таблице в нем.
+
+Память по умолчанию — прирост пикового RSS процесса за этап (resource.getrusage): замер почти
+бесплатный, но показывает только рост сверх прежнего пика процесса. Точный пик этапа по tracemalloc
+включается переменной окружения REPORT_TRACE_MEMORY=1 или переключателем в боковой панели:
+tracemalloc запускается на время одного этапа верхнего уровня (с вложенными) и останавливается
+после него. Трассировка замедляет разбор в 2–3 раза и общая для процесса, поэтому ею одновременно
+владеет только один этап; этапы других сессий в это время замеряются по RSS.
+
+После перезапуска timer.log() дописывает этапы строками JSON в METRICS_LOG_PATH,
+а load_metrics_log() читает журнал в таблицу для анализа трендов.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows — пиковый RSS недоступен, память этапов не замеряется
+    resource = None
+
+# Замерять пик памяти этапов через tracemalloc (REPORT_TRACE_MEMORY=1 / true / yes / on);
+# по умолчанию — прирост пикового RSS
+TRACE_MEMORY = os.environ.get("REPORT_TRACE_MEMORY", "").strip().lower() in ("1", "true", "yes", "on")
+
+# Журнал замеров (строки JSON) и его размер, после которого он переименовывается в *.1
+METRICS_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".stage_metrics.jsonl")
+METRICS_LOG_MAX_MB = 16
+
+STAGE_COLUMNS = ["этап", "вызовов", "мс", "строк на входе", "строк на выходе", "память МБ", "замер памяти"]
+
+MB = 2 ** 20
+
+# Разделитель имен вложенных этапов
+NESTED = " › "
+
+# Таймер страницы, выполняющейся в этом потоке (Streamlit выполняет каждую сессию в своем потоке)
+_current = threading.local()
+
+# tracemalloc общий для процесса: им владеет не больше одного этапа верхнего уровня
+_trace_lock = threading.Lock()
+
+
+def _max_rss():
+    """Пиковый RSS процесса в байтах (ru_maxrss — килобайты в Linux и байты в macOS) или None."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def count_rows(value):
+    """Число строк таблицы, накопителя UTM или первой таблицы кортежа; None, если это не таблица."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(getattr(value, "rows", None), int):
+        return value.rows
+    if isinstance(value, tuple):
+        for item in value:
+            rows = count_rows(item)
+            if rows is not None:
+                return rows
+    return None
+
+
+def _add_rows(total, rows):
+    return total if rows is None else (total or 0) + rows
+
+
+class Stage:
+    """Один выполняющийся этап; rows_in / rows_out можно задать внутри with, если их не посчитать по таблицам."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.memory = None
+        self.start_memory = None
+        self.peak_memory = None
+
+
+class StageTimer:
+    """Время, строки и память этапов текущего перезапуска страницы (попадание в кэш — доли миллисекунды)."""
+
+    def __init__(self, page="", trace_memory=None):
+        self.page = page
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self.tracing = False
+        self.started = time.perf_counter()
+        self.records = {}
+        self.running = []
+        _current.timer = self
+
+    def _record(self, stage, seconds):
+        record = self.records.setdefault(stage.name, {"calls": 0, "seconds": 0.0, "rows_in": None,
+                                                      "rows_out": None, "peak_mb": None, "memory": None})
+        record["calls"] += 1
+        record["seconds"] += seconds
+        record["rows_in"] = _add_rows(record["rows_in"], stage.rows_in)
+        record["rows_out"] = _add_rows(record["rows_out"], stage.rows_out)
+        if stage.memory is not None:
+            peak = (stage.peak_memory - stage.start_memory) / MB
+            record["peak_mb"] = max(record["peak_mb"] or 0.0, peak)
+            record["memory"] = stage.memory
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Выполняет блок как этап name (внутри другого этапа — как вложенный)."""
+        parent = self.running[-1] if self.running else None
+        stage = Stage(parent.name + NESTED + name if parent else name)
+        if parent is None and self.trace_memory and _trace_lock.acquire(blocking=False):
+            # Трассировка, запущенная не нами (например, PYTHONTRACEMALLOC), не трогается
+            if tracemalloc.is_tracing():
+                _trace_lock.release()
+            else:
+                tracemalloc.start()
+                self.tracing = True
+
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent.peak_memory = max(parent.peak_memory, peak)
+            tracemalloc.reset_peak()
+            stage.memory = "tracemalloc"
+            stage.start_memory = stage.peak_memory = current
+        else:
+            stage.start_memory = stage.peak_memory = _max_rss()
+            stage.memory = None if stage.start_memory is None else "RSS"
+        self.running.append(stage)
+        started = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            seconds = time.perf_counter() - started
+            self.running.pop()
+            if self.tracing:
+                stage.peak_memory = max(stage.peak_memory, tracemalloc.get_traced_memory()[1])
+                if parent is not None:
+                    parent.peak_memory = max(parent.peak_memory, stage.peak_memory)
+                else:
+                    tracemalloc.stop()
+                    self.tracing = False
+                    _trace_lock.release()
+            elif stage.memory is not None:
+                stage.peak_memory = _max_rss()
+            self._record(stage, seconds)
+
+    def run(self, name, func, *args, **kwargs):
+        """Выполняет func как этап name; строки считаются по таблицам в аргументах и результате."""
+        with self.stage(name) as stage:
+            for value in list(args) + list(kwargs.values()):
+                stage.rows_in = _add_rows(stage.rows_in, count_rows(value))
+            result = func(*args, **kwargs)
+            stage.rows_out = count_rows(result)
+            return result
+
+    def frame(self):
+        """Таблица этапов для боковой панели."""
+        rows = [[name, record["calls"], round(record["seconds"] * 1000, 1), record["rows_in"], record["rows_out"],
+                 None if record["peak_mb"] is None else round(record["peak_mb"], 2), record["memory"]]
+                for name, record in self.records.items()]
+        return pd.DataFrame(rows, columns=STAGE_COLUMNS).astype({"строк на входе": "Int64", "строк на выходе": "Int64"})
+
+    def summary(self):
+        """Строка для интерфейса: полное время перезапуска и время этапов верхнего уровня в миллисекундах."""
+        total = (time.perf_counter() - self.started) * 1000
+        stages = ", ".join(f"{name} {record['seconds'] * 1000:.0f}"
+                           for name, record in self.records.items() if NESTED not in name)
+        return f"Перезапуск страницы: {total:.0f} мс" + (f" ({stages})" if stages else "")
+
+    def log(self, path=None):
+        """Дописывает этапы перезапуска в журнал строками JSON; ошибки записи не мешают странице."""
+        if not self.records:
+            return
+        path = path or METRICS_LOG_PATH
+        logged_at = pd.Timestamp.now().isoformat(timespec="seconds")
+        total = time.perf_counter() - self.started
+        lines = [json.dumps({"time": logged_at, "page": self.page, "stage": name, "total_seconds": round(total, 4),
+                             **record}, ensure_ascii=False)
+                 for name, record in self.records.items()]
+        try:
+            if os.path.exists(path) and os.path.getsize(path) > METRICS_LOG_MAX_MB * MB:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            pass
+
+
+def current_timer():
+    """Таймер страницы, выполняющейся в этом потоке, или None."""
+    return getattr(_current, "timer", None)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Этап текущей страницы; вне страницы блок выполняется без замеров."""
+    timer = current_timer()
+    if timer is None:
+        yield Stage(name)
+        return
+    with timer.stage(name) as running:
+        yield running
+
+
+def timed(name, rows_in=None, rows_out=None):
+    """
+    Декоратор: вызов функции — этап name текущей страницы.
+    rows_in / rows_out — функции, считающие строки по аргументам / результату, если count_rows не подходит.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = current_timer()
+            if timer is None:
+                return func(*args, **kwargs)
+            if rows_in is None and rows_out is None:
+                return timer.run(name, func, *args, **kwargs)
+            with timer.stage(name) as running:
+                if rows_in is not None:
+                    running.rows_in = rows_in(*args, **kwargs)
+                result = func(*args, **kwargs)
+                running.rows_out = rows_out(result) if rows_out is not None else count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def load_metrics_log(path=None):
+    """Журнал замеров (вместе с предыдущим *.1) как таблица: строка на этап каждого перезапуска."""
+    path = path or METRICS_LOG_PATH
+    frames = [pd.read_json(p, lines=True) for p in (path + ".1", path) if os.path.exists(p) and os.path.getsize(p)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
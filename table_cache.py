@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow не установлен — дисковый кэш отключается
+    pa = None
+
+# Версия нормализации входных таблиц: увеличивать при любом изменении разбора,
+# чтобы старые записи кэша перестали находиться
+PIPELINE_VERSION = 3
+
+# Папка дискового кэша нормализованных таблиц и её предельный объем
+TABLE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".table_cache")
+TABLE_CACHE_MAX_MB = 2048
+
+_EXTRA_KEY = b"table_cache.extra"
+
+
+def _to_arrow(df, extra):
+    """
+    Таблица Arrow из DataFrame. Столбцы object со смешанными типами (например, '№', где
+    номера площадок соседствуют с названиями разделов) сохраняются строками.
+    """
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_EXTRA_KEY] = json.dumps(extra, ensure_ascii=False, default=str).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def _from_arrow(table):
+    """(DataFrame, extra) из таблицы Arrow, записанной _to_arrow."""
+    extra = json.loads(table.schema.metadata.get(_EXTRA_KEY, b"null"))
+    return table.to_pandas(), extra
+
+
+class TableCache:
+    """
+    Дисковый кэш нормализованных таблиц в формате Arrow IPC (Feather v2, без сжатия).
+
+    Запись делается один раз после первого разбора Excel; при следующих загрузках того же файла
+    (в любой сессии и после перезапуска сервера) таблица читается с диска через memory map
+    вместо повторного разбора .xlsx. Ключ — хэш содержимого файла, имя этапа, его аргументы
+    и PIPELINE_VERSION. Вместе с таблицей хранится небольшой JSON (extra) — например,
+    ошибки разбора или строки над заголовком.
+
+    Если pyarrow не установлен или папка недоступна для записи, кэш прозрачно отключается.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = pa is not None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path_for(self, key):
+        digest = hashlib.sha256(repr((PIPELINE_VERSION,) + tuple(key)).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.arrow")
+
+    def load(self, path):
+        """
+        Читает таблицу через memory map. Возвращает (df, extra).
+        Memory map избавляет только от буфера чтения файла: to_pandas() копирует данные в DataFrame,
+        зато таблица получается обычной изменяемой (страницы правят ее на месте).
+        Время изменения файла обновляется, чтобы prune вытеснял давно не читавшиеся записи (LRU).
+        """
+        with pa.memory_map(path, "r") as source:
+            df, extra = _from_arrow(pa.ipc.open_file(source).read_all())
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # Запись могли удалить параллельно — таблица уже прочитана
+        return df, extra
+
+    def store(self, path, table):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        self.prune()
+
+    def prune(self):
+        """Удаляет давно не использованные записи (по времени записи или последнего чтения), пока кэш больше max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".arrow"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def get_or_build(self, key, builder):
+        """
+        Возвращает (df, extra) из кэша или строит их через builder() и сохраняет.
+        builder должен возвращать пару (DataFrame, extra), где extra сериализуется в JSON.
+
+        При промахе возвращается та же таблица Arrow, что записана на диск, переведенная в pandas:
+        типы столбцов и extra совпадают с будущими попаданиями (смешанные столбцы object — строки,
+        имена столбцов — строки), и результат не зависит от того, был ли файл уже в кэше.
+        """
+        if not self.enabled:
+            return builder()
+
+        path = self.path_for(key)
+        if os.path.exists(path):
+            try:
+                result = self.load(path)
+                with self.lock:
+                    self.hits += 1
+                return result
+            except (OSError, pa.ArrowException, ValueError):
+                pass  # Поврежденная запись — перестраиваем
+
+        with self.lock:
+            self.misses += 1
+        df, extra = builder()
+        try:
+            table = _to_arrow(df, extra)
+        except (pa.ArrowException, TypeError, ValueError):
+            return df, extra  # Таблица не переводится в Arrow — работаем без кэша
+        try:
+            self.store(path, table)
+        except (OSError, pa.ArrowException):
+            pass  # Не удалось сохранить — возвращаем ту же таблицу, что и при попадании
+        return _from_arrow(table)
+
+    def summary(self):
+        """Строка со статистикой для вывода в интерфейсе."""
+        if not self.enabled:
+            return "Дисковый кэш таблиц отключен (нет pyarrow)"
+        return f"Дисковый кэш таблиц: попаданий {self.hits}, промахов {self.misses}"
+
+
+TABLE_CACHE = TableCache(TABLE_CACHE_DIR, TABLE_CACHE_MAX_MB * 2**20)
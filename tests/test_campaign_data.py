@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_coverage import legacy, make_stats
+from campaign_data import adjust_coverage, safe_divide
+
+
+def vectorized(df):
+    return adjust_coverage(df["охват"], df["показы"]), safe_divide(df["клики"], df["показы"])
+
+
+def assert_matches_legacy(df):
+    old_coverage, old_ctr = legacy(df)
+    coverage, ctr = vectorized(df)
+    np.testing.assert_array_equal(coverage.to_numpy(dtype=float), old_coverage.to_numpy())
+    np.testing.assert_array_equal(ctr.to_numpy(dtype=float), old_ctr.to_numpy())
+
+
+@pytest.mark.parametrize("coverage, impressions, clicks", [
+    (np.nan, 1000.0, 10.0),     # пустой охват
+    (0.0, 1000.0, 10.0),        # нулевой охват
+    ("0", 1000.0, 10.0),        # нулевой охват строкой
+    ("", 1000.0, 10.0),         # пустая строка
+    (500.0, 0.0, 0.0),          # нулевые показы
+    (500.0, np.nan, 3.0),       # пустые показы
+    (0.25, 100.0, 1.0),         # доля с двумя знаками
+    (0.025, 100.0, 1.0),        # доля с тремя знаками — процент
+    ("0,025", 100.0, 1.0),      # то же с десятичной запятой
+    (0.5, 10_000.0, 50.0),      # показов больше охвата в 10 раз
+    (1234.6, 2000.0, 7.0),      # дробный охват округляется
+    (100.0, 1001.0, 7.0),       # граница коэффициента 10
+    (100.0, 1000.0, 7.0),
+])
+def test_edge_cases_match_row_wise_code(coverage, impressions, clicks):
+    df = pd.DataFrame({"показы": [impressions], "клики": [clicks], "охват": pd.Series([coverage], dtype=object)})
+    assert_matches_legacy(df)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_synthetic_exports_match_row_wise_code(seed):
+    assert_matches_legacy(make_stats(2_000, seed))
+
+
+def test_numeric_coverage_column_matches_row_wise_code():
+    df = make_stats(2_000, seed=3)
+    df["охват"] = pd.to_numeric(df["охват"].astype(str).str.replace(",", "."), errors="coerce")
+    assert_matches_legacy(df)
+
+
+def test_zero_impressions_give_zero_ctr():
+    ctr = safe_divide(pd.Series([5.0, 5.0, 0.0]), pd.Series([0.0, np.nan, 10.0]))
+    assert ctr.tolist() == [0.0, 0.0, 0.0]
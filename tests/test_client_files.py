@@ -0,0 +1,41 @@
+import pytest
+
+from client_files import client_key, file_role, pair_files
+
+
+@pytest.mark.parametrize("file_name, client", [
+    ("Компания_utm.xlsx", "Компания"),
+    ("Ampera_mp.xlsx", "Ampera"),
+    ("Шампунь МП.xlsx", "Шампунь"),
+    ("Outmost метки.csv", "Outmost"),
+    ("Ромашка_utm_mp.xlsx", "Ромашка"),
+    ("mp-Ромашка.xlsx", "Ромашка"),
+    ("Ромашка медиаплан.xlsx", "Ромашка"),
+    ("Компания.xlsx", "Компания"),
+])
+def test_client_key_removes_only_standalone_role_words(file_name, client):
+    assert client_key(file_name) == client
+
+
+def test_client_key_keeps_name_made_of_role_letters():
+    assert client_key("Шампунь.xlsx") == "Шампунь"
+    assert client_key("mp.xlsx") == "mp"
+
+
+@pytest.mark.parametrize("file_name, role", [
+    ("Ромашка_utm.xlsx", "Метки"),
+    ("Ромашка метки.xlsx", "Метки"),
+    ("Ромашка.csv", "Метки"),
+    ("Outmost.xlsx", "Медиаплан"),
+    ("Компания_mp.xlsx", "Медиаплан"),
+])
+def test_file_role(file_name, role):
+    assert file_role(file_name) == role
+
+
+def test_pair_files_keeps_clients_with_role_letters_apart():
+    clients = pair_files(["Шампунь МП.xlsx", "Шампунь utm.xlsx", "Ша унь МП.xlsx"])
+    assert clients["Клиент"].tolist() == ["Ша унь", "Шампунь"]
+    row = clients.set_index("Клиент").loc["Шампунь"]
+    assert row["Медиаплан"] == "Шампунь МП.xlsx"
+    assert row["Метки"] == "Шампунь utm.xlsx"
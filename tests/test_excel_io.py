@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+from openpyxl import Workbook
+
+import excel_io
+from excel_io import iter_sheet_rows, locate_header
+
+pytest.importorskip("python_calamine")
+
+
+@pytest.fixture
+def offset_workbook(tmp_path):
+    """Таблица со сдвигом: пустые строки сверху и столбцы слева, отчетный период над заголовком."""
+    wb = Workbook()
+    ws = wb.active
+    ws["B1"] = "Период: 01.02.2025 - 28.02.2025"
+    ws.append([])
+    ws.append([None, None, "UTM Source", "Сеансы", "Дата"])
+    ws.append([None, None, "yandex", 10, datetime.datetime(2025, 2, 3)])
+    ws.append([None, None, "vk", 2.5, None])
+    path = tmp_path / "offset.xlsx"
+    wb.save(path)
+    return path
+
+
+def test_calamine_rows_match_openpyxl_from_a1(offset_workbook):
+    calamine_rows = list(iter_sheet_rows(offset_workbook, backend="calamine"))
+    openpyxl_rows = list(iter_sheet_rows(offset_workbook, backend="openpyxl"))
+    assert calamine_rows == openpyxl_rows
+    assert calamine_rows[2] == ["", "", "UTM Source", "Сеансы", "Дата"]
+
+
+def test_header_search_stops_without_converting_whole_sheet(offset_workbook, monkeypatch):
+    converted = []
+    convert = excel_io._convert_calamine
+    monkeypatch.setattr(excel_io, "_convert_calamine", lambda value: converted.append(value) or convert(value))
+
+    preamble, header, rows = locate_header(offset_workbook, ["utm source"], backend="calamine", header_only=True)
+
+    assert header == ["", "", "UTM Source", "Сеансы", "Дата"]
+    assert rows == []
+    assert len(preamble) == 2
+    assert "yandex" not in converted
+
+
+def test_empty_sheet_has_no_rows(tmp_path):
+    path = tmp_path / "empty.xlsx"
+    Workbook().save(path)
+    assert list(iter_sheet_rows(path, backend="calamine")) == []
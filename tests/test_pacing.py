@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pacing
+from pacing import PlanCube
+
+
+def make_plan():
+    return pd.DataFrame({
+        'Название сайта': ['site1', 'site2', 'site3', 'site4'],
+        'Категория': ['Медийка', 'Медийка', 'Performance', None],
+        'Start Date': pd.to_datetime(['2025-03-01', '2025-03-10', '2025-03-05', None]),
+        'End Date': pd.to_datetime(['2025-03-31', '2025-03-16', '2025-04-03', '2025-03-20']),
+        'Бюджет': [31_000.0, 7_000.0, 30_000.0, 5_000.0],
+        'KPI прогноз': [310, 70, 300, 50],
+    })
+
+
+@pytest.mark.parametrize("start, end", [
+    ('2025-03-03', '2025-03-09'),
+    ('2025-03-01', '2025-04-30'),
+    ('2025-02-01', '2025-03-01'),
+    ('2025-04-01', '2025-04-10'),
+])
+def test_cube_without_dense_matrices_gives_same_windows(monkeypatch, start, end):
+    dense = PlanCube.from_plan(make_plan(), 'Бюджет')
+    monkeypatch.setattr(pacing, 'PLAN_CUBE_MAX_CELLS', 0)
+    lazy = PlanCube.from_plan(make_plan(), 'Бюджет')
+
+    assert dense.site_budget is not None and lazy.site_budget is None
+    for by in ('category', 'site'):
+        pd.testing.assert_frame_equal(dense.window(start, end, by=by), lazy.window(start, end, by=by))
+    assert dense.progress(end) == lazy.progress(end)
+
+
+def test_week_window_sums_daily_plan():
+    window = PlanCube.from_plan(make_plan(), 'Бюджет').window('2025-03-03', '2025-03-09', by='site')
+    budget = dict(zip(window['Название сайта'], window['Бюджет']))
+    assert budget == pytest.approx({'site1': 7_000.0, 'site3': 5_000.0})
+
+
+def test_mistyped_year_does_not_allocate_day_matrices():
+    # 100 строк × 2205 − 2025 годов дней — больше PLAN_CUBE_MAX_CELLS
+    plan = pd.concat([make_plan()] * 25, ignore_index=True)
+    plan.loc[0, 'End Date'] = pd.Timestamp('2205-03-31')
+
+    cube = PlanCube.from_plan(plan, 'Бюджет')
+
+    assert cube.site_budget is None
+    assert len(plan) * cube.n_days > pacing.PLAN_CUBE_MAX_CELLS
+    week = cube.window('2025-03-10', '2025-03-16', by='site')
+    assert week.loc[week['Название сайта'] == 'site2', 'Бюджет'].sum() == pytest.approx(7_000.0 * 25)
+    assert np.isclose(cube.progress('2205-03-31')[0], 1.0)
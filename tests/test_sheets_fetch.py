@@ -0,0 +1,96 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sheets_fetch import SheetFetcher
+
+RESPONSE_DELAY = 0.3
+
+
+class CsvHandler(BaseHTTPRequestHandler):
+    """CSV по пути /<имя> с ETag; на совпадающий If-None-Match отвечает 304."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("If-None-Match")))
+            body = server.bodies[self.path]
+        time.sleep(RESPONSE_DELAY)
+        etag = f'"{hash(body)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), CsvHandler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.bodies = {f"/{i}": f"площадка,показы\nsite{i},{i * 100}\n".encode() for i in range(4)}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = lambda path: f"http://127.0.0.1:{httpd.server_address[1]}{path}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_all_downloads_in_parallel(server):
+    fetcher = SheetFetcher(max_workers=4)
+    urls = [server.url(f"/{i}") for i in range(4)]
+
+    started = time.perf_counter()
+    results = fetcher.fetch_all(urls)
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < RESPONSE_DELAY * 3
+    assert [results[url]["показы"].iloc[0] for url in urls] == [0, 100, 200, 300]
+
+
+def test_expired_entry_is_revalidated_with_etag(server):
+    fetcher = SheetFetcher(ttl=0)
+    url = server.url("/1")
+
+    first = fetcher._download(url)
+    second = fetcher._download(url)
+
+    assert [etag is None for _, etag in server.requests] == [True, False]
+    assert second["df"] is first["df"]  # 304 — таблица не разбиралась заново
+
+    server.bodies["/1"] = "площадка,показы\nsite1,150\n".encode()
+    third = fetcher._download(url)
+    assert third["df"]["показы"].iloc[0] == 150
+
+
+def test_fresh_entry_does_not_touch_network(server):
+    fetcher = SheetFetcher(ttl=300)
+    url = server.url("/2")
+    fetcher.fetch_all([url])
+    fetcher.fetch_all([url])
+    assert len(server.requests) == 1
+
+
+def test_cache_is_bounded_by_entries_and_bytes(server):
+    fetcher = SheetFetcher(max_entries=2)
+    fetcher.fetch_all([server.url("/0"), server.url("/1")])
+    fetcher.fetch_all([server.url("/0")])  # /0 использовалась недавно — вытесняется /1
+    fetcher.fetch_all([server.url("/2")])
+    assert list(fetcher.entries) == [server.url("/0"), server.url("/2")]
+
+    fetcher = SheetFetcher(max_bytes=1)
+    results = fetcher.fetch_all([server.url("/3")])
+    assert len(results[server.url("/3")]) == 1
+    assert not fetcher.entries and fetcher.size == 0
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from table_cache import TableCache  # noqa: E402
+
+
+def build():
+    # '№' как в медиаплане: номера площадок вперемешку с названиями разделов
+    df = pd.DataFrame({"№": [1, "Digital", 2, None], "бюджет": [10.0, None, 5.5, 1.0], 3: ["a", "b", "c", "d"]})
+    return df, {"period": pd.Timestamp("2025-02-01"), "errors": []}
+
+
+def test_miss_returns_same_table_as_hit(tmp_path):
+    cache = TableCache(str(tmp_path), 2**30)
+
+    miss_df, miss_extra = cache.get_or_build(("digest", "media_plan"), build)
+    hit_df, hit_extra = cache.get_or_build(("digest", "media_plan"), build)
+
+    assert (cache.misses, cache.hits) == (1, 1)
+    pd.testing.assert_frame_equal(miss_df, hit_df)
+    assert miss_extra == hit_extra == {"period": "2025-02-01 00:00:00", "errors": []}
+    assert miss_df["№"].tolist()[:3] == ["1", "Digital", "2"]
+    assert miss_df["№"].isna().tolist() == [False, False, False, True]
+    assert list(miss_df.columns) == ["№", "бюджет", "3"]
+
+
+def test_unwritable_directory_still_returns_normalized_table(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = TableCache(str(blocker / "cache"), 2**30)
+
+    df, _ = cache.get_or_build(("digest", "media_plan"), build)
+
+    assert df["№"].tolist()[:3] == ["1", "Digital", "2"]
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from utm import WeightedAccumulator, weighted_summary
+
+
+def make_utm():
+    return pd.DataFrame({
+        'UTM Source': ['yandex', 'yandex', 'vk', 'vk'],
+        'UTM Campaign': ['c1', 'c2', 'c1', 'c1'],
+        'UTM Medium': ['cpc', 'cpc', 'social', 'social'],
+        'Визиты': [10, 30, 5, 0],
+        'Посетители': [8, 20, 5, 0],
+        'Отказы': [0.1, 0.3, 0.5, 0.9],
+        'Глубина просмотра': [2.0, 1.0, 3.0, 1.0],
+        'Роботность': [0.0, 0.1, 0.2, 0.0],
+        'Время на сайте': pd.to_timedelta([60, 30, 120, 0], unit='s'),
+    })
+
+
+def test_accumulator_matches_weighted_summary_across_chunks():
+    df = make_utm()
+    accumulator = WeightedAccumulator()
+    accumulator.add(df.iloc[:2])
+    accumulator.add(df.iloc[2:])
+
+    summary, totals = accumulator.summary()
+    expected_summary, expected_totals = weighted_summary(df)
+
+    pd.testing.assert_frame_equal(summary.sort_values('UTM Source').reset_index(drop=True),
+                                  expected_summary.sort_values('UTM Source').reset_index(drop=True),
+                                  check_dtype=False)
+    pd.testing.assert_series_equal(totals, expected_totals, check_dtype=False)
+
+
+def test_empty_accumulator_returns_empty_summary():
+    summary, totals = WeightedAccumulator().summary()
+    expected_summary, expected_totals = weighted_summary(make_utm().iloc[:0])
+
+    assert summary.empty
+    assert list(summary.columns) == list(expected_summary.columns)
+    pd.testing.assert_series_equal(totals, expected_totals, check_dtype=False)
+    assert totals['Визиты'] == 0 and totals.isna()['Отказы']
+
+
+def test_empty_accumulator_sums_round_trip():
+    sums = WeightedAccumulator().sums_by('UTM Campaign')
+    assert sums.empty and sums.index.name == 'UTM Campaign'
+    summary, _ = WeightedAccumulator.from_sums(sums).summary('UTM Campaign')
+    assert summary.empty and summary.columns[0] == 'UTM Campaign'
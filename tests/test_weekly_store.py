@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from weekly_store import WeeklyStore
+
+HEADER = "UTM Source;UTM Campaign;UTM Medium;Визиты;Посетители;Отказы;Глубина просмотра;Роботность;Время на сайте\n"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return WeeklyStore(str(tmp_path / "store.sqlite"))
+
+
+@pytest.fixture
+def utm_file(tmp_path):
+    """Выгрузка меток CSV: период в первой строке, строки (источник, визиты)."""
+    def make(name, start, end, rows):
+        path = tmp_path / name
+        lines = [f"Отчет за период с {start} по {end}\n", HEADER]
+        lines += [f"{source};arwm_1;cpc;{visits};{visits};0.2;2;0.1;0:01:00\n" for source, visits in rows]
+        path.write_text("".join(lines), encoding="utf-8")
+        return str(path)
+    return make
+
+
+def visits(store, client):
+    table = store.weekly_summary([client])
+    return {(week.strftime('%Y-%m-%d'), source): value
+            for week, source, value in table[['Неделя', 'UTM Source', 'Визиты']].itertuples(index=False)}
+
+
+def test_cumulative_upload_keeps_only_increment(store, utm_file):
+    store.ingest('client', utm_file('w1.csv', '2025-02-03', '2025-02-09', [('a', 10), ('b', 5)]))
+    store.ingest('client', utm_file('w2.csv', '2025-02-03', '2025-02-16', [('a', 17), ('b', 5)]))
+    assert visits(store, 'client') == {('2025-02-03', 'a'): 10, ('2025-02-03', 'b'): 5,
+                                       ('2025-02-10', 'a'): 7, ('2025-02-10', 'b'): 0}
+
+
+def test_corrected_week_updates_later_cumulative_weeks(store, utm_file):
+    store.ingest('client', utm_file('w1.csv', '2025-02-03', '2025-02-09', [('a', 10)]))
+    store.ingest('client', utm_file('w2.csv', '2025-02-03', '2025-02-16', [('a', 17)]))
+    result = store.ingest('client', utm_file('w1b.csv', '2025-02-03', '2025-02-09', [('a', 12)]))
+    assert result['status'] == 'replaced'
+    assert [week.strftime('%Y-%m-%d') for week in result['updated']] == ['2025-02-10']
+    assert visits(store, 'client') == {('2025-02-03', 'a'): 12, ('2025-02-10', 'a'): 5}
+
+
+def test_same_file_is_skipped(store, utm_file):
+    path = utm_file('w1.csv', '2025-02-03', '2025-02-09', [('a', 10)])
+    assert store.ingest('client', path)['status'] == 'inserted'
+    assert store.ingest('client', path)['status'] == 'skipped'
+
+
+def test_parallel_ingest_of_same_file_writes_once(tmp_path, utm_file):
+    # Отдельные хранилища на один файл SQLite — как разные процессы: общей блокировки потоков нет
+    path = utm_file('w1.csv', '2025-02-03', '2025-02-09', [('a', 10)])
+    stores = [WeeklyStore(str(tmp_path / "store.sqlite")) for _ in range(4)]
+    statuses = []
+    threads = [threading.Thread(target=lambda s=s: statuses.append(s.ingest('client', path)['status']))
+               for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == ['inserted', 'skipped', 'skipped', 'skipped']
+
+
+def test_week_across_months_is_split_by_days(store, utm_file):
+    store.ingest('client', utm_file('w1.csv', '2025-03-24', '2025-03-30', [('a', 70)]))
+    # Неделя 31.03–06.04: один день в марте, шесть в апреле
+    store.ingest('client', utm_file('w2.csv', '2025-03-31', '2025-04-06', [('a', 140)]))
+
+    march, _ = store.month_to_date('client', '2025-03-31').summary()
+    april, april_totals = store.month_to_date('client', '2025-04-06').summary()
+
+    assert march['Визиты'].sum() == pytest.approx(70 + 20)
+    assert april['Визиты'].sum() == pytest.approx(120)
+    assert april_totals['Отказы'] == pytest.approx(0.2)
+    campaign, _ = store.campaign_to_date('client', '2025-04-06').summary()
+    assert campaign['Визиты'].sum() == pytest.approx(march['Визиты'].sum() + april['Визиты'].sum())
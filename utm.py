@@ -0,0 +1,134 @@
+import pandas as pd
+
+# Показатели Метрики, которые усредняются с весом по визитам
+WEIGHTED_METRICS = ['Отказы', 'Глубина просмотра', 'Роботность', 'Время на сайте']
+
+# Показатели, которые просто суммируются
+SUM_METRICS = ['Визиты', 'Посетители']
+
+# Ключи, по которым можно группировать выгрузку UTM
+GROUP_KEYS = ['UTM Source', 'UTM Campaign', 'UTM Medium']
+
+
+def _metric_values(series):
+    """
+    Значения показателя для взвешивания: длительности переводятся в секунды,
+    float32 компактного профиля — в float64, чтобы суммы по всей выгрузке не теряли точность.
+    """
+    if pd.api.types.is_timedelta64_dtype(series):
+        return series.dt.total_seconds()
+    return pd.to_numeric(series, errors='coerce').astype('float64')
+
+
+def _weighted_work(df, weight, metrics, sums):
+    """Столбцы для суммирования: вес, суммируемые показатели и «показатель × вес»."""
+    weights = pd.to_numeric(df[weight], errors='coerce')
+    work = pd.DataFrame({weight: weights}, index=df.index)
+    for col in sums:
+        work[col] = pd.to_numeric(df[col], errors='coerce')
+    for col in metrics:
+        work[col] = _metric_values(df[col]) * weights
+    return work
+
+
+def _finish(grouped, totals, by, weight, metrics, sums):
+    """Средние из накопленных сумм: «показатель × вес» делится на сумму весов."""
+    grouped = grouped.copy()
+    totals = totals.copy()
+    for col in metrics:
+        grouped[col] = grouped[col] / grouped[weight]
+        totals[col] = totals[col] / totals[weight] if totals[weight] else float('nan')
+
+    summary = grouped[[weight] + sums + metrics].rename_axis(by).reset_index()
+    return summary, totals[[weight] + sums + metrics]
+
+
+def weighted_summary(df, by='UTM Source', weight='Визиты', metrics=WEIGHTED_METRICS, sums=SUM_METRICS):
+    """
+    Считает сводку по UTM за один проход groupby:
+      - суммы для столбцов sums (визиты, посетители)
+      - средневзвешенные по weight значения для metrics (отказы, глубина, роботность, время)
+
+    Для каждого показателя заранее считается столбец «показатель × визиты», после чего
+    все столбцы суммируются одним groupby, а средние получаются делением на сумму весов.
+    Время на сайте усредняется в секундах (столбец timedelta тоже переводится в секунды).
+
+    Возвращает (summary, totals): таблицу по ключу by и Series с итогами по всем строкам.
+    """
+    metrics = [m for m in metrics if m in df.columns]
+    sums = [s for s in sums if s in df.columns and s != weight]
+
+    work = _weighted_work(df, weight, metrics, sums)
+    return _finish(work.groupby(df[by]).sum(), work.sum(), by, weight, metrics, sums)
+
+
+class WeightedAccumulator:
+    """
+    Взвешенная сводка UTM по частям таблицы с постоянной памятью.
+
+    add() сворачивает очередную порцию строк в суммы по сочетаниям ключей keys
+    (вес, суммируемые показатели и «показатель × вес»), поэтому хранится не больше строк,
+    чем различных сочетаний источник/кампания/канал, независимо от размера выгрузки.
+    summary(by) дает ту же таблицу и итоги, что weighted_summary по всем строкам сразу.
+    """
+
+    def __init__(self, keys=GROUP_KEYS, weight='Визиты', metrics=WEIGHTED_METRICS, sums=SUM_METRICS):
+        self.keys = list(keys)
+        self.weight = weight
+        self.metrics = list(metrics)
+        self.sums = [s for s in sums if s != weight]
+        self.parts = None
+        self.rows = 0
+
+    @property
+    def nbytes(self):
+        """Объем накопленных сумм в памяти (для учета в кэше книг)."""
+        return 0 if self.parts is None else int(self.parts.memory_usage(deep=True).sum())
+
+    def add(self, df):
+        if self.parts is None:
+            # Состав ключей и показателей определяется по первой порции
+            self.keys = [k for k in self.keys if k in df.columns]
+            self.metrics = [m for m in self.metrics if m in df.columns]
+            self.sums = [s for s in self.sums if s in df.columns and s != self.weight]
+
+        work = _weighted_work(df, self.weight, self.metrics, self.sums)
+        # Ключи приводятся к строкам: в разных порциях CSV один и тот же источник может прочитаться числом
+        keys = [df[k].where(df[k].isna(), df[k].astype(str)) for k in self.keys]
+        grouped = work.groupby(keys, dropna=False).sum()
+        if self.parts is not None:
+            grouped = pd.concat([self.parts, grouped]).groupby(level=self.keys, dropna=False).sum()
+        self.parts = grouped
+        self.rows += len(df)
+
+    def _empty_sums(self, by):
+        """Суммы без строк (ничего не добавлено): те же столбцы, индекс — ключ by."""
+        return pd.DataFrame(columns=[self.weight] + self.sums + self.metrics, dtype='float64',
+                            index=pd.Index([], dtype=object, name=by))
+
+    def summary(self, by='UTM Source'):
+        """
+        Возвращает (summary, totals) по ключу by, как weighted_summary.
+        Если ничего не добавлено (например, все строки отфильтрованы), сводка пуста, а итоги нулевые
+        (средние — NaN), как у weighted_summary по пустой таблице.
+        """
+        if self.parts is None:
+            grouped = self._empty_sums(by)
+            return _finish(grouped, grouped.sum(), by, self.weight, self.metrics, self.sums)
+        return _finish(self.parts.groupby(level=by).sum(), self.parts.sum(), by,
+                       self.weight, self.metrics, self.sums)
+
+    def sums_by(self, by='UTM Source'):
+        """Накопленные суммы по ключу by: вес, суммируемые показатели и «показатель × вес» (пустой ключ сохраняется)."""
+        if self.parts is None:
+            return self._empty_sums(by)
+        return self.parts.groupby(level=by, dropna=False).sum()
+
+    @classmethod
+    def from_sums(cls, sums, weight='Визиты', metrics=WEIGHTED_METRICS, sum_cols=SUM_METRICS):
+        """Накопитель из готовых сумм (как их возвращает sums_by()), например сохраненных между запусками."""
+        accumulator = cls(keys=[sums.index.name], weight=weight,
+                          metrics=[m for m in metrics if m in sums.columns],
+                          sums=[s for s in sum_cols if s in sums.columns and s != weight])
+        accumulator.parts = sums
+        return accumulator
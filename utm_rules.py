@@ -0,0 +1,189 @@
+"""
+Правила проверки показателей UTM: пороги задаются конфигурацией, а не кодом страниц.
+
+Правило — словарь:
+    name      — имя правила (по нему задаются пороги клиентов);
+    metric    — столбец сводки ('Отказы', 'Время на сайте', ...) или производный показатель
+                'Доля визитов' (доля источника в визитах клиента за неделю);
+    change    — 'week': сравнивается не сам показатель, а его изменение к прошлой неделе (доля);
+    op        — '>', '>=', '<' или '<=';
+    threshold — порог по умолчанию;
+    format    — вывод значения: 'percent', 'change', 'duration' (секунды в Ч:ММ:СС) или 'number';
+    message   — начало текста предупреждения.
+
+Конфигурация — список правил или {"rules": [...], "clients": {клиент: {имя правила: порог}}};
+она читается из UTM_RULES_PATH (JSON), если файл есть, иначе действуют DEFAULT_RULES.
+
+Все правила проверяются одним сравнением матрицы значений (строки × правила) с матрицей порогов,
+поэтому одна и та же проверка подходит и для сводки одного отчета, и для таблицы всех клиентов
+и недель из хранилища. Результат — таблица предупреждений и привычные текстовые сообщения.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from durations import format_durations
+
+# Файл с правилами и порогами клиентов (необязательный)
+UTM_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utm_rules.json")
+
+# Правила по умолчанию — прежние проверки отчета ГЕО
+DEFAULT_RULES = [
+    {"name": "bounce", "metric": "Отказы", "op": ">", "threshold": 0.35, "format": "percent",
+     "message": "Высокий процент отказов"},
+    {"name": "robots", "metric": "Роботность", "op": ">", "threshold": 0.10, "format": "percent",
+     "message": "Высокая роботность"},
+    {"name": "time", "metric": "Время на сайте", "op": "<", "threshold": 60, "format": "duration",
+     "message": "Низкое время на сайте"},
+]
+
+# Столбцы клиента и недели в таблицах нескольких клиентов и недель
+CLIENT_COL = "Клиент"
+WEEK_COL = "Неделя"
+
+VISITS_SHARE = "Доля визитов"
+
+WARNING_COLUMNS = [CLIENT_COL, WEEK_COL, "источник", "правило", "показатель", "значение", "порог", "сообщение"]
+
+# Сравнение: знак, приводящий его к «больше», и нестрогость
+_OPS = {">": (1, False), ">=": (1, True), "<": (-1, False), "<=": (-1, True)}
+
+_FORMATS = {
+    "percent": lambda values: values.map(lambda v: f"{v * 100:.2f}%"),
+    "change": lambda values: values.map(lambda v: f"{v * 100:+.1f}%"),
+    "duration": format_durations,
+    "number": lambda values: values.map(lambda v: f"{v:.2f}"),
+}
+
+
+def _rule_column(rule):
+    """Столбец значений правила: показатель или его изменение к прошлой неделе."""
+    return f"{rule['metric']} к прошлой неделе" if rule.get("change") == "week" else rule["metric"]
+
+
+class RuleSet:
+    """Скомпилированные правила: порядок, знаки сравнений, пороги по умолчанию и пороги клиентов."""
+
+    def __init__(self, rules=DEFAULT_RULES, clients=None):
+        self.rules = []
+        names = set()
+        for rule in rules:
+            missing = [key for key in ("name", "metric", "op", "threshold") if key not in rule]
+            if missing:
+                raise ValueError(f"В правиле {rule} нет ключей: {', '.join(missing)}")
+            if rule["op"] not in _OPS:
+                raise ValueError(f"Правило «{rule['name']}»: неизвестное сравнение {rule['op']!r}")
+            if rule.get("format", "number") not in _FORMATS:
+                raise ValueError(f"Правило «{rule['name']}»: неизвестный формат {rule['format']!r}")
+            if rule["name"] in names:
+                raise ValueError(f"Правило «{rule['name']}» задано дважды")
+            names.add(rule["name"])
+            self.rules.append({"format": "number", "message": rule["name"], **rule})
+
+        self.clients = {str(client): dict(overrides) for client, overrides in (clients or {}).items()}
+        for client, overrides in self.clients.items():
+            unknown = set(overrides) - names
+            if unknown:
+                raise ValueError(f"Пороги клиента «{client}» для неизвестных правил: {', '.join(sorted(unknown))}")
+
+        self.columns = [_rule_column(rule) for rule in self.rules]
+        self.signs = np.array([_OPS[rule["op"]][0] for rule in self.rules], dtype="float64")
+        self.inclusive = np.array([_OPS[rule["op"]][1] for rule in self.rules])
+        self.defaults = np.array([rule["threshold"] for rule in self.rules], dtype="float64")
+
+    @classmethod
+    def from_config(cls, config):
+        """Правила из конфигурации: список правил или словарь с ключами 'rules' и 'clients'."""
+        if isinstance(config, list):
+            return cls(config)
+        return cls(config.get("rules", DEFAULT_RULES), config.get("clients"))
+
+    @classmethod
+    def load(cls, path=UTM_RULES_PATH):
+        """Правила из JSON-файла; если файла нет — правила по умолчанию."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    def _values(self, table, by):
+        """Матрица значений (строки × правила); производные показатели считаются по таблице, NaN — нет данных."""
+        table = table.copy()
+        groups = [col for col in (CLIENT_COL, WEEK_COL) if col in table.columns]
+        if any(rule["metric"] == VISITS_SHARE for rule in self.rules) and "Визиты" in table.columns:
+            visits = table["Визиты"].astype("float64")
+            total = visits.groupby([table[col] for col in groups]).transform("sum") if groups else visits.sum()
+            table[VISITS_SHARE] = visits / total
+        for rule, column in zip(self.rules, self.columns):
+            if rule.get("change") == "week" and WEEK_COL in table.columns and rule["metric"] in table.columns:
+                keys = [col for col in (CLIENT_COL, by) if col in table.columns]
+                previous = table.sort_values(WEEK_COL).groupby(keys, dropna=False)[rule["metric"]].shift(1)
+                table[column] = table[rule["metric"]] / previous.where(previous != 0) - 1
+        return table.reindex(columns=self.columns).apply(pd.to_numeric, errors="coerce").to_numpy("float64")
+
+    def _thresholds(self, table, client):
+        """Матрица порогов: по умолчанию из правил, для клиентов с особыми порогами — их значения."""
+        thresholds = np.tile(self.defaults, (len(table), 1))
+        if CLIENT_COL in table.columns:
+            clients = table[CLIENT_COL].astype(str).to_numpy()
+        else:
+            clients = np.full(len(table), "" if client is None else str(client))
+        for name, overrides in self.clients.items():
+            rows = clients == name
+            if rows.any():
+                for j, rule in enumerate(self.rules):
+                    if rule["name"] in overrides:
+                        thresholds[rows, j] = overrides[rule["name"]]
+        return thresholds
+
+    def evaluate(self, table, by="UTM Source", client=None):
+        """
+        Таблица предупреждений по сводке table (по строке на нарушенное правило, в порядке строк и правил).
+        Если в таблице есть столбцы 'Клиент' / 'Неделя', пороги и изменения считаются по ним;
+        иначе пороги берутся для клиента client.
+        """
+        table = table.reset_index(drop=True)
+        values = self._values(table, by)
+        thresholds = self._thresholds(table, client)
+        signed, limits = values * self.signs, thresholds * self.signs
+        with np.errstate(invalid="ignore"):
+            mask = np.where(self.inclusive, signed >= limits, signed > limits)
+        rows, positions = np.nonzero(mask)
+
+        warnings = pd.DataFrame({
+            CLIENT_COL: table[CLIENT_COL].to_numpy()[rows] if CLIENT_COL in table.columns else client,
+            WEEK_COL: table[WEEK_COL].to_numpy()[rows] if WEEK_COL in table.columns else None,
+            "источник": table[by].to_numpy()[rows] if by in table.columns else None,
+            "правило": [self.rules[j]["name"] for j in positions],
+            "показатель": [self.columns[j] for j in positions],
+            "значение": values[rows, positions],
+            "порог": thresholds[rows, positions],
+        }, columns=WARNING_COLUMNS[:-1])
+
+        # Форматируются и собираются в текст только строки-нарушения, их немного
+        formatted = np.empty(len(warnings), dtype=object)
+        formats = np.array([self.rules[j]["format"] for j in positions], dtype=object)
+        for name, formatter in _FORMATS.items():
+            selected = formats == name
+            if selected.any():
+                formatted[selected] = formatter(warnings.loc[selected, "значение"]).to_numpy()
+
+        prefixes = [""] * len(warnings)
+        if CLIENT_COL in table.columns:
+            prefixes = [f"{prefix}{client_name}, " for prefix, client_name in zip(prefixes, warnings[CLIENT_COL])]
+        if WEEK_COL in table.columns:
+            prefixes = [f"{prefix}неделя с {pd.Timestamp(week):%d.%m.%Y}: "
+                        for prefix, week in zip(prefixes, warnings[WEEK_COL])]
+        warnings["сообщение"] = [f"{prefix}⚠ {self.rules[j]['message']} ({value}) для источника {source}"
+                                 for prefix, j, value, source in zip(prefixes, positions, formatted, warnings["источник"])]
+        return warnings
+
+    def messages(self, table, by="UTM Source", client=None):
+        """Текстовые предупреждения (как раньше выводились на страницах отчета)."""
+        return self.evaluate(table, by, client)["сообщение"].tolist()
+
+
+# Правила, действующие в отчетах (из UTM_RULES_PATH или по умолчанию)
+UTM_RULES = RuleSet.load()
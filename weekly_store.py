@@ -0,0 +1,285 @@
+"""
+Хранилище недельных агрегатов UTM (SQLite) для инкрементальной загрузки выгрузок.
+
+Для каждого клиента, недели и источника хранятся суммы: визиты, посетители и «показатель × визиты»
+для взвешенных средних. Неделя выгрузки — неделя (пн–вс), в которую попадает конец отчетного периода.
+Если выгрузка накопительная (период начинается раньше этой недели), в хранилище записывается
+только прирост: из сумм выгрузки вычитаются уже сохраненные недели внутри её периода.
+Когда неделя загружается задним числом (исправленная или пропущенная выгрузка), приросты более
+поздних накопительных недель, в период которых она попадает, пересчитываются на разницу сумм.
+
+Повторная загрузка уже сохраненного файла не разбирает его вовсе (проверяется хэш содержимого),
+а сводки за месяц и с начала кампании строятся из сохраненных сумм, без исходных строк.
+Неделя на стыке месяцев делится между ними по дням.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from excel_io import file_digest
+from geo_report import open_utm, read_utm_period
+from utm import SUM_METRICS, WEIGHTED_METRICS, WeightedAccumulator
+
+# Файл хранилища по умолчанию
+REPORT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".report_store.sqlite")
+
+# Столбцы таблицы сумм для показателей выгрузки
+MEASURE_COLUMNS = {
+    'Визиты': 'visits',
+    'Посетители': 'visitors',
+    'Отказы': 'bounce_x_visits',
+    'Глубина просмотра': 'depth_x_visits',
+    'Роботность': 'robots_x_visits',
+    'Время на сайте': 'seconds_x_visits',
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS uploads (
+    client TEXT NOT NULL,
+    week_start TEXT NOT NULL,
+    week_end TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    file_digest TEXT NOT NULL,
+    loaded_at TEXT NOT NULL,
+    PRIMARY KEY (client, week_start)
+);
+CREATE TABLE IF NOT EXISTS utm_weekly (
+    client TEXT NOT NULL,
+    week_start TEXT NOT NULL,
+    source TEXT NOT NULL,
+    {", ".join(f"{col} REAL NOT NULL DEFAULT 0" for col in MEASURE_COLUMNS.values())},
+    PRIMARY KEY (client, week_start, source)
+);
+CREATE INDEX IF NOT EXISTS uploads_digest ON uploads (client, file_digest);
+"""
+
+
+def week_bounds(day):
+    """Понедельник и воскресенье недели, в которую попадает day."""
+    day = pd.Timestamp(day).normalize()
+    week_start = day - pd.Timedelta(days=day.weekday())
+    return week_start, week_start + pd.Timedelta(days=6)
+
+
+class WeeklyStore:
+    """Недельные суммы UTM по клиентам в SQLite (один файл на все сессии и пакетные запуски)."""
+
+    def __init__(self, path=REPORT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        """
+        Соединение на одну операцию: фиксирует изменения при успехе и всегда закрывается.
+        immediate=True — вся операция, включая чтения, идет в одной транзакции BEGIN IMMEDIATE:
+        другие процессы не могут записать между чтением сохраненных сумм и записью новых.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                if immediate:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            conn.close()
+
+    def weeks(self, client):
+        """Сохраненные недели клиента с периодами исходных выгрузок."""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT week_start, week_end, period_start, period_end, file_digest, loaded_at "
+                "FROM uploads WHERE client = ? ORDER BY week_start", conn, params=(client,),
+                parse_dates=['week_start', 'week_end', 'period_start', 'period_end'])
+
+    def _stored_sums(self, conn, client, first_week, last_week, within=None):
+        """
+        Суммы по источникам за недели с first_week по last_week включительно.
+        within=(start, end) — от каждой недели берется доля сумм по числу её дней внутри периода.
+        """
+        params = (client, first_week.strftime('%Y-%m-%d'), last_week.strftime('%Y-%m-%d'))
+        if within is None:
+            columns = ", ".join(f"SUM({col}) AS {col}" for col in MEASURE_COLUMNS.values())
+            sums = pd.read_sql_query(
+                f"SELECT source, {columns} FROM utm_weekly "
+                f"WHERE client = ? AND week_start BETWEEN ? AND ? GROUP BY source", conn, params=params)
+        else:
+            weekly = pd.read_sql_query(
+                f"SELECT week_start, source, {', '.join(MEASURE_COLUMNS.values())} FROM utm_weekly "
+                f"WHERE client = ? AND week_start BETWEEN ? AND ?", conn, params=params, parse_dates=['week_start'])
+            start, end = within
+            days = ((weekly['week_start'] + pd.Timedelta(days=6)).clip(upper=end)
+                    - weekly['week_start'].clip(lower=start)).dt.days + 1
+            measures = list(MEASURE_COLUMNS.values())
+            weekly[measures] = weekly[measures].mul(days.clip(lower=0) / 7, axis=0)
+            sums = weekly.groupby('source', as_index=False)[measures].sum()
+        sums = sums.set_index('source').rename(columns={v: k for k, v in MEASURE_COLUMNS.items()})
+        sums.index = sums.index.where(sums.index != '', None)
+        sums.index.name = 'UTM Source'
+        return sums
+
+    def _week_sums(self, conn, client, week):
+        """Сохраненные суммы одной недели; пустой источник — '' (как в таблице хранилища)."""
+        sums = self._stored_sums(conn, client, week, week)
+        sums.index = sums.index.where(sums.index.notna(), '')
+        return sums
+
+    def _write_week(self, conn, client, week, sums):
+        """Перезаписывает суммы недели week по источникам."""
+        conn.execute("DELETE FROM utm_weekly WHERE client = ? AND week_start = ?",
+                     (client, week.strftime('%Y-%m-%d')))
+        measures = [m for m in MEASURE_COLUMNS if m in sums.columns]
+        conn.executemany(
+            f"INSERT INTO utm_weekly (client, week_start, source, "
+            f"{', '.join(MEASURE_COLUMNS[m] for m in measures)}) "
+            f"VALUES (?, ?, ?{', ?' * len(measures)})",
+            [(client, week.strftime('%Y-%m-%d'), str(source), *map(float, values))
+             for source, values in zip(sums.index, sums[measures].fillna(0).itertuples(index=False, name=None))])
+
+    def _update_later_weeks(self, conn, client, week, change):
+        """
+        Пересчитывает приросты накопительных недель после week, когда суммы week изменились на change.
+        Прирост более поздней недели — ее накопительные суммы минус сохраненные недели внутри ее периода,
+        поэтому он уменьшается на изменение этих недель (в том числе изменений, внесенных этим пересчетом).
+        Возвращает список пересчитанных недель.
+        """
+        changes = {week: change}
+        later = conn.execute("SELECT week_start, period_start FROM uploads WHERE client = ? AND week_start > ? "
+                             "ORDER BY week_start", (client, week.strftime('%Y-%m-%d'))).fetchall()
+        updated = []
+        for later_week, period_start in later:
+            later_week = pd.Timestamp(later_week)
+            first_week, _ = week_bounds(period_start)
+            inside = [delta for changed_week, delta in changes.items() if first_week <= changed_week < later_week]
+            if not inside:
+                continue
+            shift = pd.concat(inside).groupby(level=0).sum()
+            if not shift.to_numpy().any():
+                continue
+            stored = self._week_sums(conn, client, later_week)
+            self._write_week(conn, client, later_week, stored.sub(shift.reindex(columns=stored.columns), fill_value=0))
+            changes[later_week] = -shift
+            updated.append(later_week)
+        return updated
+
+    def weekly_summary(self, clients=None):
+        """
+        Средние показатели по клиентам, неделям и источникам (столбцы 'Клиент', 'Неделя', 'UTM Source'
+        и показатели сводки UTM) — для проверки правил utm_rules сразу по всем клиентам и неделям.
+        clients — список клиентов (по умолчанию все).
+        """
+        query = f"SELECT client, week_start, source, {', '.join(MEASURE_COLUMNS.values())} FROM utm_weekly"
+        params = ()
+        if clients is not None:
+            clients = [str(client) for client in clients]
+            query += f" WHERE client IN ({', '.join('?' * len(clients))})"
+            params = tuple(clients)
+        with self._connect() as conn:
+            table = pd.read_sql_query(query + " ORDER BY client, week_start, source", conn, params=params,
+                                      parse_dates=['week_start'])
+        table = table.rename(columns={'client': 'Клиент', 'week_start': 'Неделя', 'source': 'UTM Source',
+                                      **{v: k for k, v in MEASURE_COLUMNS.items()}})
+        table['UTM Source'] = table['UTM Source'].where(table['UTM Source'] != '', None)
+        visits = table['Визиты'].where(table['Визиты'] > 0)
+        for metric in WEIGHTED_METRICS:
+            table[metric] = table[metric] / visits
+        return table
+
+    def _uploaded_week(self, conn, client, digest):
+        """Строка (week_start,) недели, в которую уже загружен файл с хэшем digest, или None."""
+        return conn.execute("SELECT week_start FROM uploads WHERE client = ? AND file_digest = ?",
+                            (client, digest)).fetchone()
+
+    def ingest(self, client, file, exclude_sources=()):
+        """
+        Загружает выгрузку UTM клиента.
+        Если этот файл уже загружен, он не разбирается. Если его неделя уже есть (исправленная выгрузка),
+        неделя перезаписывается. Приросты более поздних накопительных недель пересчитываются.
+        Возвращает словарь со статусом ('skipped' / 'inserted' / 'replaced'), неделей
+        и списком пересчитанных более поздних недель ('updated').
+        """
+        digest = file_digest(file)
+        with self._connect() as conn:
+            row = self._uploaded_week(conn, client, digest)
+        if row is not None:
+            return {'status': 'skipped', 'week_start': pd.Timestamp(row[0]), 'updated': []}
+
+        period_start, period_end = read_utm_period(file)
+        if pd.isna(period_start) or pd.isna(period_end):
+            raise ValueError("Не удалось извлечь отчетный период из первой строки файла с метками.")
+        week_start, week_end = week_bounds(period_end)
+
+        utm, _ = open_utm(file, exclude_sources)
+        if not isinstance(utm, WeightedAccumulator):
+            accumulator = WeightedAccumulator(keys=['UTM Source'])
+            accumulator.add(utm)
+            utm = accumulator
+        sums = utm.sums_by('UTM Source')
+        sums.index = sums.index.where(sums.index.notna(), '')
+
+        # Чтения сохраненных сумм и запись — одна транзакция: пока файл разбирался, его могли загрузить
+        # в другой сессии или пакетным запуском, а накопительные суммы — измениться
+        with self.lock, self._connect(immediate=True) as conn:
+            row = self._uploaded_week(conn, client, digest)
+            if row is not None:
+                return {'status': 'skipped', 'week_start': pd.Timestamp(row[0]), 'updated': []}
+            replaced = conn.execute("SELECT 1 FROM uploads WHERE client = ? AND week_start = ?",
+                                    (client, week_start.strftime('%Y-%m-%d'))).fetchone() is not None
+            # Накопительная выгрузка: вычитаем недели, уже сохраненные внутри её периода
+            first_week, _ = week_bounds(period_start)
+            if first_week < week_start:
+                earlier = self._stored_sums(conn, client, first_week, week_start - pd.Timedelta(days=7))
+                earlier.index = earlier.index.where(earlier.index.notna(), '')
+                sums = sums.sub(earlier.reindex(columns=sums.columns), fill_value=0)
+
+            previous = self._week_sums(conn, client, week_start)
+            self._write_week(conn, client, week_start, sums)
+            change = sums.sub(previous.reindex(columns=sums.columns), fill_value=0)
+            updated = self._update_later_weeks(conn, client, week_start, change)
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (client, week_start.strftime('%Y-%m-%d'), week_end.strftime('%Y-%m-%d'),
+                 period_start.strftime('%Y-%m-%d'), period_end.strftime('%Y-%m-%d'), digest,
+                 datetime.now().isoformat(timespec='seconds')))
+        return {'status': 'replaced' if replaced else 'inserted', 'week_start': week_start, 'updated': updated}
+
+    def accumulator(self, client, start, end, within=None):
+        """
+        WeightedAccumulator по источникам из сохраненных недель, пересекающихся с периодом [start, end]
+        (неделя берется целиком, а при within=(начало, конец) — долей дней внутри этого периода).
+        Подходит для geo_report.summarize_utm. None, если недель нет.
+        """
+        first_week, _ = week_bounds(start)
+        last_week, _ = week_bounds(end)
+        with self._connect() as conn:
+            sums = self._stored_sums(conn, client, first_week, last_week, within)
+        if sums.empty:
+            return None
+        return WeightedAccumulator.from_sums(sums, metrics=WEIGHTED_METRICS, sum_cols=SUM_METRICS)
+
+    def month_to_date(self, client, as_of):
+        """
+        Суммы с начала месяца даты as_of по её неделю включительно. Неделя на стыке месяцев
+        входит долей своих дней в этом месяце (суммы недели распределяются по дням поровну),
+        поэтому суммы соседних месяцев вместе равны суммам их недель, без двойного счета.
+        Средние показатели от деления не меняются.
+        """
+        as_of = pd.Timestamp(as_of).normalize()
+        month_start = as_of.replace(day=1)
+        month_end = month_start + pd.offsets.MonthEnd(0)
+        return self.accumulator(client, month_start, as_of, within=(month_start, month_end))
+
+    def campaign_to_date(self, client, as_of):
+        """Суммы с первой сохраненной недели клиента по as_of."""
+        weeks = self.weeks(client)
+        if weeks.empty:
+            return None
+        return self.accumulator(client, weeks['week_start'].min(), as_of)